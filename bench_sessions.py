@@ -0,0 +1,327 @@
+# bench_sessions.py
+# Drive thousands of lecture sessions and day plans through the real state
+# machine using the in-process fake window driver, covering page reloads,
+# login, failed actions and the planned-row fallback. Each scenario's runs
+# are checked against the outcomes and states it should produce; the exit
+# status is non-zero if any check fails.
+
+import argparse
+import asyncio
+import contextlib
+import io
+import random
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import metrics
+import seatsomatic
+from fakedriver import FakeDriver, FakePage
+from fixtures import MODULES, ROOMS, local_time, make_lecture, row_text
+from seatsomatic import ENGINE, OPENED_EVENTS, OPEN_WINDOWS, DayPlan
+
+# page: FakePage options; presenter: presenter mode for lecture runs
+# outcomes: how runs may end; visits: "STATE/outcome" keys every scenario
+# run must produce at least once; never: states (or STATE/outcome keys)
+# that must not appear
+SCENARIOS = {
+    "lecture": {
+        "outcomes": {"closed"},
+        "visits": {"OPEN_QRCODE/ok"},
+        "never": {"HOLD_QRCODE", "LOGIN_TO_SYSTEM"},
+    },
+    "presenter": {
+        "presenter": True,
+        "outcomes": {"closed"},
+        "visits": {"PRESENT_QRCODE/ok"},
+        "never": {"HOLD_QRCODE"},
+    },
+    "presenter_unreadable": {
+        "page": {"outcomes": {"JSExtractQRCode": (True, False)}},
+        "presenter": True,
+        "outcomes": {"closed"},
+        "visits": {"OPEN_QRCODE/failed", "HOLD_QRCODE/ok"},
+        "never": {"PRESENT_QRCODE"},
+    },
+    "logged_out": {
+        "page": {"logged_in": False},
+        "outcomes": {"closed"},
+        "visits": {"NAVIGATE_TO_PAGE/failed", "LOGIN_TO_SYSTEM/ok"},
+    },
+    "reloads": {
+        "page": {"reload_rate": 0.2},
+        "outcomes": {"closed"},
+        "visits": {"OPEN_QRCODE/ok"},
+        "never": {"HOLD_QRCODE"},
+    },
+    "failures": {
+        "page": {"fail_rate": 0.05},
+        "outcomes": {"closed", "stopped"},
+    },
+    "planned": {
+        "outcomes": {"closed"},
+        "visits": {"OPEN_PLANNED_QRCODE/ok"},
+        "never": {"DO_SEARCH"},
+    },
+    "planned_missing": {
+        "page": {"outcomes": {"JSClickPlannedRow": (True, {"clicked": False, "candidates": []})}},
+        "outcomes": {"closed"},
+        "visits": {"OPEN_PLANNED_QRCODE/failed", "DO_SEARCH/ok"},
+    },
+    # the event's row drops out of the plan after it was first used, as when
+    # the plan is replaced at midnight
+    "planned_replaced": {
+        "drop_planned_row": True,
+        "outcomes": {"closed"},
+        "visits": {"OPEN_PLANNED_QRCODE/ok", "OPEN_QRCODE/ok"},
+        "never": {"DO_SEARCH"},
+    },
+    "day_plan": {
+        "outcomes": {"planned"},
+        "visits": {"SCRAPE_ROWS/ok"},
+    },
+    "day_plan_failures": {
+        "page": {"fail_rate": 0.05},
+        "outcomes": {"planned", "plan failed"},
+        "never": {"LOGIN_TO_SYSTEM"},
+    },
+    "day_plan_logged_out": {
+        "page": {"logged_in": False},
+        "outcomes": {"plan failed"},
+        "visits": {"NAVIGATE_TO_PAGE/failed"},
+        "never": {"LOGIN_TO_SYSTEM"},
+    },
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Run lecture sessions against a fake window driver."
+    )
+    parser.add_argument(
+        "--runs", type=int, default=500, help="Runs per scenario (default 500)"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=200, help="Sessions running at once"
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=1,
+        help="Maximum simulated latency per action in ms",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=30, help="Seconds before a run counts as stuck"
+    )
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=sorted(SCENARIOS),
+        help="Only run these scenarios (repeatable)",
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--verbose", "-v", action="store_true", help="Show session output"
+    )
+    return parser.parse_args()
+
+
+def make_event(index, day):
+    return make_lecture(
+        local_time(day, 9 + index % 9, 15 * (index % 4)),
+        MODULES[index % len(MODULES)],
+        ROOMS[index % len(ROOMS)],
+        label=str(index),
+    )
+
+
+def make_page(options, rng, latency, **extra):
+    return FakePage(
+        latency=(0, latency),
+        seed=rng.random(),
+        **{**options, **extra},
+    )
+
+
+# a stopped session leaves its window up for the user, so it's left open
+# here and only closed once the scenario's windows have been counted
+async def finish(task, window, timeout):
+    done, _ = await asyncio.wait({task}, timeout=timeout)
+    if not done:
+        seatsomatic.DRIVER.destroy(window)
+        return "stuck"
+    if task.cancelled():
+        return "closed"
+    if task.exception() is not None:
+        return f"error: {task.exception()!r}"
+    return "stopped"
+
+
+async def run_lecture(name, index, rng, args, day):
+    scenario = SCENARIOS[name]
+    event = make_event(index, day)
+    if name.startswith("planned"):
+        seatsomatic.DAY_PLAN.targets[event] = row_text(event)
+    options = dict(scenario.get("page", {}))
+    if scenario.get("drop_planned_row"):
+        options["hooks"] = {
+            "JSClickPlannedRow": lambda: seatsomatic.DAY_PLAN.targets.pop(event, None)
+        }
+    page = make_page(
+        options,
+        rng,
+        args.latency / 1000,
+        close_after=rng.randint(20, 60),
+    )
+    seatsomatic.DRIVER.prepare(f"Lecture: {event.summary}", page)
+    seatsomatic.PRESENTER_MODE = scenario.get("presenter", False)
+    session = seatsomatic.open_lecture_webview(event)
+    outcome = await finish(session.task, session.window, args.timeout)
+    OPENED_EVENTS.discard(event)
+    return outcome, page
+
+
+async def run_day_plan(name, index, rng, args, day):
+    day = day + timedelta(days=index)
+    events = [make_event(index * 4 + i, day) for i in range(4)]
+    page = make_page(
+        SCENARIOS[name].get("page", {}),
+        rng,
+        args.latency / 1000,
+        rows=[row_text(e) for e in events],
+    )
+    seatsomatic.DRIVER.prepare(f"Day plan {day}", page)
+    planner = seatsomatic.start_day_plan(day, events)
+    outcome = await finish(planner.task, planner.window, args.timeout)
+    # the planner closes its own window when done, so it usually ends "closed"
+    if outcome != "stuck" and not outcome.startswith("error"):
+        if planner.plan.failed or planner.plan.captured_at is None:
+            outcome = "plan failed"
+        elif len(planner.plan.targets) != len(events):
+            outcome = "plan incomplete"
+        else:
+            outcome = "planned"
+    return outcome, page
+
+
+def state_counts():
+    counts = Counter()
+    series = metrics.REGISTRY.histograms.get("seatsomatic_state_duration_seconds", {})
+    for key, (_, _, count, _) in series.items():
+        labels = dict(key)
+        counts[f"{labels['state']}/{labels['outcome']}"] += count
+    return counts
+
+
+async def run_scenario(name, args):
+    rng = random.Random(f"{args.seed}-{name}")
+    metrics.REGISTRY = metrics.Registry()
+    today = datetime.now().date()
+    if name.startswith("planned"):
+        seatsomatic.DAY_PLAN = DayPlan(today)
+        seatsomatic.DAY_PLAN.captured_at = seatsomatic.CLOCK.now()
+    runner = run_day_plan if name.startswith("day_plan") else run_lecture
+    limit = asyncio.Semaphore(args.concurrency)
+
+    async def one(index):
+        async with limit:
+            return await runner(name, index, rng, args, today)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(args.runs)))
+    wall = time.perf_counter() - started
+    pages = [page for _, page in results]
+    outcomes = Counter(outcome for outcome, _ in results)
+    # only stopped sessions should still have a window up
+    open_windows = seatsomatic.DRIVER.window_count()
+    open_sessions = len(OPEN_WINDOWS)
+    # then close them as the user would, which must clean everything up
+    for window in list(OPEN_WINDOWS.values()):
+        seatsomatic.DRIVER.destroy(window)
+    report = {
+        "runs": args.runs,
+        "wall": wall,
+        "outcomes": outcomes,
+        "actions": sum(len(page.actions) for page in pages),
+        "reloads": sum(page.reloads for page in pages),
+        "failures": sum(page.failures for page in pages),
+        "states": state_counts(),
+        "open_after_runs": open_windows,
+        "left_open": len(OPEN_WINDOWS) + seatsomatic.DRIVER.window_count(),
+    }
+    report["problems"] = check(SCENARIOS[name], report, open_sessions)
+    return report
+
+
+def check(scenario, report, open_sessions):
+    problems = []
+    unexpected = set(report["outcomes"]) - scenario["outcomes"]
+    if unexpected:
+        problems.append(
+            "unexpected outcomes: "
+            + ", ".join(f"{k}={report['outcomes'][k]}" for k in sorted(unexpected))
+        )
+    stopped = report["outcomes"]["stopped"]
+    if report["open_after_runs"] != stopped or open_sessions != stopped:
+        problems.append(
+            f"{report['open_after_runs']} windows and {open_sessions} sessions "
+            f"open after the runs, expected {stopped} (the stopped ones)"
+        )
+    if report["left_open"]:
+        problems.append(f"{report['left_open']} windows left open after closing")
+    states = report["states"]
+    missing = scenario.get("visits", set()) - set(states)
+    if missing:
+        problems.append("never visited: " + ", ".join(sorted(missing)))
+    never = scenario.get("never", set())
+    seen = sorted(k for k in states if k in never or k.split("/")[0] in never)
+    if seen:
+        problems.append("should not visit: " + ", ".join(seen))
+    return problems
+
+
+async def bench(args):
+    seatsomatic.DRIVER = FakeDriver(ENGINE.loop)
+    reports = {}
+    for name in args.scenario or SCENARIOS:
+        reports[name] = await run_scenario(name, args)
+    return reports
+
+
+def print_report(reports):
+    total_runs = total_wall = 0
+    failed = []
+    for name, report in reports.items():
+        total_runs += report["runs"]
+        total_wall += report["wall"]
+        print(
+            f"{name}: {report['runs']} runs in {report['wall']:.2f}s "
+            f"({report['runs'] / report['wall']:.0f} runs/s), "
+            f"{report['actions']} actions, {report['reloads']} reloads, "
+            f"{report['failures']} injected failures"
+        )
+        print("  outcomes: " + ", ".join(f"{k}={v}" for k, v in report["outcomes"].most_common()))
+        print("  states:   " + ", ".join(f"{k}={v}" for k, v in sorted(report["states"].items())))
+        for problem in report["problems"]:
+            print(f"  FAILED: {problem}")
+        if report["problems"]:
+            failed.append(name)
+    print(f"total: {total_runs} runs in {total_wall:.2f}s")
+    if failed:
+        print("failed scenarios: " + ", ".join(failed))
+    return not failed
+
+
+def main():
+    args = parse_args()
+    ENGINE.start()
+    quiet = contextlib.redirect_stdout(io.StringIO())
+    with contextlib.nullcontext() if args.verbose else quiet:
+        reports = ENGINE.submit(bench(args)).result()
+    if not print_report(reports):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
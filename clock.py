@@ -0,0 +1,35 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytz
+
+
+# Wall clock used by the scheduler. Anything that needs "now" should ask the
+# clock it was given rather than calling datetime.now, so the simulator can
+# swap in a VirtualClock.
+class SystemClock:
+    def now(self):
+        return datetime.now(pytz.utc)
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+
+# A clock that only moves when told to. sleep() advances virtual time
+# instantly, so a scheduler loop can run through weeks in seconds.
+class VirtualClock:
+    def __init__(self, start):
+        self.current = start
+
+    def now(self):
+        return self.current
+
+    def advance(self, seconds):
+        self.current += timedelta(seconds=seconds)
+
+    def set(self, when):
+        self.current = when
+
+    async def sleep(self, seconds):
+        self.advance(seconds)
+        await asyncio.sleep(0)
@@ -0,0 +1,118 @@
+from abc import ABC, abstractmethod
+
+import webview
+
+# Everything the sessions do to a browser window goes through a driver, so
+# the state machine can run against something other than pywebview (see
+# fakedriver.py). Windows are opaque handles returned by create_window and
+# passed back into the driver's methods.
+
+
+class WindowDriver(ABC):
+    # True if calls can block (e.g. wait for the GUI thread), in which case
+    # the engine runs them off its loop; a non-blocking driver is called
+    # directly on the loop thread.
+    blocking = True
+
+    @abstractmethod
+    def create_window(self, title, url=None, **options):
+        pass
+
+    # make Python callables available to the page as window.pywebview.api.*
+    @abstractmethod
+    def expose(self, window, *functions):
+        pass
+
+    @abstractmethod
+    def on_loaded(self, window, handler):
+        pass
+
+    @abstractmethod
+    def remove_loaded(self, window, handler):
+        pass
+
+    @abstractmethod
+    def on_closed(self, window, handler):
+        pass
+
+    @abstractmethod
+    def run_js(self, window, script):
+        pass
+
+    @abstractmethod
+    def evaluate_js(self, window, script):
+        pass
+
+    # start a JSAction; its result comes back through the exposed
+    # action_result(token, ...) callback
+    def run_action(self, window, action, token):
+        return self.run_js(window, action.script(token))
+
+    @abstractmethod
+    def set_on_top(self, window, on_top):
+        pass
+
+    @abstractmethod
+    def show(self, window):
+        pass
+
+    @abstractmethod
+    def hide(self, window):
+        pass
+
+    @abstractmethod
+    def destroy(self, window):
+        pass
+
+    # drop the exposed callables so nothing keeps the session alive
+    @abstractmethod
+    def release(self, window):
+        pass
+
+    @abstractmethod
+    def window_count(self):
+        pass
+
+
+class PyWebviewDriver(WindowDriver):
+    def create_window(self, title, url=None, **options):
+        return webview.create_window(title, url, **options)
+
+    def expose(self, window, *functions):
+        window.expose(*functions)
+
+    def on_loaded(self, window, handler):
+        window.events.loaded += handler
+
+    def remove_loaded(self, window, handler):
+        try:
+            window.events.loaded -= handler
+        except ValueError:
+            pass
+
+    def on_closed(self, window, handler):
+        window.events.closed += handler
+
+    def run_js(self, window, script):
+        return window.run_js(script)
+
+    def evaluate_js(self, window, script):
+        return window.evaluate_js(script)
+
+    def set_on_top(self, window, on_top):
+        window.on_top = on_top
+
+    def show(self, window):
+        window.show()
+
+    def hide(self, window):
+        window.hide()
+
+    def destroy(self, window):
+        window.destroy()
+
+    def release(self, window):
+        window._functions.clear()
+
+    def window_count(self):
+        return len(webview.windows)
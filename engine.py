@@ -0,0 +1,179 @@
+import asyncio
+import itertools
+import threading
+
+
+class ActionFailed(Exception):
+    def __init__(self, result):
+        super().__init__(result)
+        self.result = result
+
+
+# Runs an asyncio loop on its own thread. Lecture sessions and the scheduler
+# are tasks on this loop, so a slow window or a long-running action never
+# holds up the GUI thread or any other session.
+class Engine:
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(
+                target=self._run, name="seatsomatic-engine", daemon=True
+            )
+            self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def in_loop(self):
+        return threading.current_thread() is self.thread
+
+    # schedule a coroutine from any thread, returns a concurrent Future
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    # call a plain function on the loop thread from any thread
+    def call_soon(self, fn, *args):
+        if self.in_loop():
+            fn(*args)
+        else:
+            self.loop.call_soon_threadsafe(fn, *args)
+
+    # run a blocking call (e.g. a pywebview window method) off the loop
+    async def blocking(self, fn, *args):
+        return await self.loop.run_in_executor(None, fn, *args)
+
+    # call a window driver method, off the loop only if the driver blocks
+    async def call_driver(self, driver, fn, *args):
+        if driver.blocking:
+            return await self.blocking(fn, *args)
+        return fn(*args)
+
+    # fire-and-forget version of call_driver, usable from plain callbacks
+    def post_driver(self, driver, fn, *args):
+        if driver.blocking:
+            self.loop.run_in_executor(None, fn, *args)
+        else:
+            self.call_soon(fn, *args)
+
+
+LOADED_JS = """
+(function() {
+    if(window.called_real_loaded){
+        return;
+    }
+    async function tryCallRealLoaded(){
+        if(window.called_real_loaded){
+            return;
+        }
+        if (window.pywebview && window.pywebview.api && window.pywebview.api.real_loaded)
+        {
+            window.called_real_loaded=true;
+            window.pywebview.api.real_loaded();
+        }
+        else{
+            window.setTimeout(tryCallRealLoaded, 200);
+        }
+    }
+    tryCallRealLoaded();
+})();"""
+
+
+# Connects one window (through its driver) to the engine. JS actions report back through
+# the exposed action_result(token, ok, value) callback, which resolves the
+# future the awaiting task is blocked on; page loads are signalled through
+# real_loaded so in-flight actions can be re-issued on the new page.
+class WindowBridge:
+    _tokens = itertools.count(1)
+
+    # page_setup is JS run on every page load, before real_loaded is called
+    def __init__(self, engine, driver, window, page_setup=""):
+        self.engine = engine
+        self.page_setup = page_setup
+        self.driver = driver
+        self.window = window
+        self.pending = {}
+        self.last_attempts = 0
+        self.page_loaded = asyncio.Event()
+        self.loaded_once = asyncio.Event()
+        driver.expose(window, self.action_result, self.real_loaded)
+        driver.on_loaded(window, self.on_loaded)
+
+    def on_loaded(self):
+        try:
+            self.driver.evaluate_js(self.window, self.page_setup + LOADED_JS)
+        except Exception as e:
+            print(f"Error in on_loaded: {e}")
+
+    def real_loaded(self, *args):
+        print("Loaded new page")
+        self.engine.call_soon(self._set_loaded)
+        return True
+
+    def _set_loaded(self):
+        self.page_loaded.set()
+        self.loaded_once.set()
+
+    def action_result(self, token, ok, value=None, attempts=0):
+        self.engine.call_soon(self._resolve, token, ok, value, attempts)
+
+    def _resolve(self, token, ok, value, attempts=0):
+        future = self.pending.pop(token, None)
+        if future is None or future.done():
+            return
+        self.last_attempts = attempts or 0
+        if ok:
+            future.set_result(value)
+        else:
+            future.set_exception(ActionFailed(value))
+
+    async def wait_loaded(self):
+        await self.loaded_once.wait()
+
+    async def run_js(self, script):
+        return await self.call(self.driver.run_js, self.window, script)
+
+    async def evaluate_js(self, script):
+        return await self.call(self.driver.evaluate_js, self.window, script)
+
+    async def call(self, fn, *args):
+        return await self.engine.call_driver(self.driver, fn, *args)
+
+    def post(self, fn, *args):
+        self.engine.post_driver(self.driver, fn, *args)
+
+    async def run_action(self, action):
+        while True:
+            token = next(WindowBridge._tokens)
+            self.last_attempts = 0
+            future = self.engine.loop.create_future()
+            self.pending[token] = future
+            self.page_loaded.clear()
+            reloaded = asyncio.ensure_future(self.page_loaded.wait())
+            try:
+                await self.call(self.driver.run_action, self.window, action, token)
+                await asyncio.wait(
+                    {future, reloaded}, return_when=asyncio.FIRST_COMPLETED
+                )
+            except Exception as e:
+                raise ActionFailed(str(e))
+            finally:
+                reloaded.cancel()
+                self.pending.pop(token, None)
+            if future.done():
+                return future.result()
+            print("Page reloaded, reapplying current action:", action)
+            future.cancel()
+
+    def release(self):
+        for future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        self.driver.remove_loaded(self.window, self.on_loaded)
+        self.driver.release(self.window)
@@ -0,0 +1,216 @@
+import random
+
+from drivers import WindowDriver
+from jsactions import (
+    JSClickBestRow,
+    JSDoSomethingWithTimeout,
+    JSExtractQRCode,
+    JSFailIfLoggedIn,
+    JSHoldWhileVisible,
+    JSHoldWhileVisibleXPath,
+    JSNavigateToMainPage,
+    JSScrapeRows,
+    JSWaitFor,
+    JSWatchQRCode,
+)
+
+# An in-process stand-in for pywebview. No browser and no JS: each JSAction
+# is answered from Python after a simulated latency, according to a FakePage
+# describing how that page behaves. It runs entirely on the engine loop, so
+# thousands of sessions can be driven through the state machine in seconds.
+
+
+class FakePage:
+    # latency: (low, high) seconds for each action to answer
+    # fail_rate: chance an action times out (resolves false) or throws
+    # reload_rate: chance the page reloads instead of answering
+    # logged_in: if False, navigation fails until the login state has run
+    # rows: what JSScrapeRows finds on the lectures table
+    # qr_changes: chance JSWatchQRCode sees a new code rather than the dialog closing
+    # close_after: actions after which the user closes the window (None: never)
+    # outcomes: {action class name: (ok, value)} to force particular answers
+    # hooks: {action class name: fn()} called each time such an action runs
+    def __init__(
+        self,
+        *,
+        latency=(0, 0.001),
+        fail_rate=0.0,
+        reload_rate=0.0,
+        logged_in=True,
+        rows=(),
+        qr_changes=0.5,
+        close_after=None,
+        outcomes=None,
+        hooks=None,
+        seed=None,
+    ):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.reload_rate = reload_rate
+        self.logged_in = logged_in
+        self.rows = list(rows)
+        self.qr_changes = qr_changes
+        self.close_after = close_after
+        self.outcomes = outcomes or {}
+        self.hooks = hooks or {}
+        self.rng = random.Random(seed)
+        self.actions = []
+        self.reloads = 0
+        self.failures = 0
+
+    def delay(self):
+        return self.rng.uniform(*self.latency)
+
+    # (ok, value) for one action, as the JS would have reported it
+    def respond(self, action):
+        hook = self.hooks.get(type(action).__name__)
+        if hook is not None:
+            hook()
+        forced = self.outcomes.get(type(action).__name__)
+        if forced is not None:
+            return forced
+        if self.rng.random() < self.fail_rate:
+            self.failures += 1
+            if isinstance(action, JSWaitFor):
+                # readiness waits give up and carry on rather than failing
+                return True, {"waited": 0, "met": False}
+            if isinstance(action, JSDoSomethingWithTimeout):
+                return True, False
+            return False, "Error: injected failure"
+        if isinstance(action, JSWaitFor):
+            return True, {"waited": int(self.delay() * 1000), "met": True}
+        if isinstance(action, JSFailIfLoggedIn):
+            # on the sign-in pages; the rest of the login state succeeds
+            self.logged_in = True
+            return True, True
+        if isinstance(action, JSNavigateToMainPage):
+            return True, self.logged_in
+        if isinstance(action, JSClickBestRow):
+            return True, {"clicked": True, "candidates": []}
+        if isinstance(action, JSScrapeRows):
+            return True, list(self.rows) or False
+        if isinstance(action, JSExtractQRCode):
+            return True, {"image": "data:image/png;base64,", "link": None, "text": ""}
+        if isinstance(action, JSWatchQRCode):
+            if self.rng.random() < self.qr_changes:
+                return True, {"image": f"data:image/png;base64,{self.rng.random()}"}
+            return True, {"closed": True}
+        return True, True
+
+
+class FakeWindow:
+    def __init__(self, title, url, page, options):
+        self.title = title
+        self.url = url
+        self.page = page
+        self.options = options
+        self.functions = {}
+        self.loaded_handlers = []
+        self.closed_handlers = []
+        self.visible = not options.get("hidden", False)
+        self.on_top = options.get("on_top", False)
+        self.closed = False
+
+
+class FakeDriver(WindowDriver):
+    blocking = False
+
+    # page_factory(title, url) returns the FakePage for a new window; pages
+    # queued with prepare() take precedence
+    def __init__(self, loop, page_factory=None):
+        self.loop = loop
+        self.page_factory = page_factory or (lambda title, url: FakePage())
+        self.prepared = {}
+        self.windows = set()
+
+    def prepare(self, title, page):
+        self.prepared[title] = page
+
+    def create_window(self, title, url=None, **options):
+        page = self.prepared.pop(title, None) or self.page_factory(title, url)
+        window = FakeWindow(title, url, page, options)
+        self.windows.add(window)
+        if url is not None:
+            self.later(window, self.load, window)
+        return window
+
+    def later(self, window, fn, *args):
+        self.loop.call_later(window.page.delay(), fn, *args)
+
+    def load(self, window):
+        if window.closed:
+            return
+        for handler in list(window.loaded_handlers):
+            handler()
+
+    def expose(self, window, *functions):
+        for fn in functions:
+            window.functions[fn.__name__] = fn
+
+    def call_api(self, window, name, *args):
+        fn = window.functions.get(name)
+        if fn is not None and not window.closed:
+            fn(*args)
+
+    def on_loaded(self, window, handler):
+        window.loaded_handlers.append(handler)
+
+    def remove_loaded(self, window, handler):
+        if handler in window.loaded_handlers:
+            window.loaded_handlers.remove(handler)
+
+    def on_closed(self, window, handler):
+        window.closed_handlers.append(handler)
+
+    def run_js(self, window, script):
+        return None
+
+    def evaluate_js(self, window, script):
+        if "real_loaded" in script:
+            self.later(window, self.call_api, window, "real_loaded")
+        return None
+
+    def run_action(self, window, action, token):
+        if window.closed:
+            raise RuntimeError("window has been closed")
+        page = window.page
+        page.actions.append(type(action).__name__)
+        if page.close_after is not None and len(page.actions) > page.close_after:
+            self.later(window, self.destroy, window)
+            return
+        if page.rng.random() < page.reload_rate:
+            page.reloads += 1
+            self.later(window, self.load, window)
+            return
+        ok, value = page.respond(action)
+        delay = page.delay()
+        if isinstance(action, (JSHoldWhileVisible, JSHoldWhileVisibleXPath)):
+            # the dialog stays up for a while before someone closes it
+            delay *= 10
+        self.loop.call_later(
+            delay, self.call_api, window, "action_result", token, ok, value, 1
+        )
+
+    def set_on_top(self, window, on_top):
+        window.on_top = on_top
+
+    def show(self, window):
+        window.visible = True
+
+    def hide(self, window):
+        window.visible = False
+
+    def destroy(self, window):
+        if window.closed:
+            return
+        window.closed = True
+        window.visible = False
+        self.windows.discard(window)
+        for handler in window.closed_handlers:
+            handler()
+
+    def release(self, window):
+        window.functions.clear()
+
+    def window_count(self):
+        return len(self.windows)
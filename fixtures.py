@@ -0,0 +1,30 @@
+# fixtures.py
+# Synthetic timetable pieces shared by simulate.py and bench_sessions.py.
+
+from datetime import datetime, timedelta
+
+import pytz
+
+from seatsomatic import Event
+
+MODULES = ["COMP/1001/01/AUT", "COMP/2003/01/AUT", "COMP/3007/01/SPR", "MATH/1012/01/FYR"]
+ROOMS = ["JC-EXCHANGE-C33", "JC-COMPSCI-A32", "UP-PORTLAND-B01", "JC-BSOUTH-A25"]
+
+TIMEZONE = pytz.timezone("Europe/London")
+
+
+def local_time(day, hour, minute=0):
+    return TIMEZONE.localize(datetime(day.year, day.month, day.day, hour, minute))
+
+
+# label is appended to the summary, e.g. to make window titles unique
+def make_lecture(start, module, room, hours=1, label=""):
+    summary = f"{module[:9]} Lecture" + (f" {label}" if label else "")
+    return Event(
+        summary, start, start + timedelta(hours=hours), f"Module code: {module}", room
+    )
+
+
+# the lecture's row as it appears in the seats app table
+def row_text(event):
+    return f"{event.module_code} Lecture {event.location} {event.start:%H:%M}"
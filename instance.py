@@ -0,0 +1,144 @@
+import getpass
+import json
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+if sys.platform == "win32":
+    import msvcrt
+else:
+    import fcntl
+
+# Only one copy of seatsomatic should run per user. The first one to lock
+# LOCK_FILE in the user's ~/.seatsomatic becomes the primary: it listens on a
+# localhost port and writes the port to PORT_FILE. Later invocations read the
+# port and send their request to it as one line of JSON and exit. The OS drops
+# the lock when the primary exits, however it exits, so there is nothing
+# stale to clean up. Localhost is shared by every user on the machine, so
+# requests carry the sender's user name and the primary refuses other users'.
+
+INSTANCE_DIR = Path.home() / ".seatsomatic"
+LOCK_FILE = INSTANCE_DIR / "instance.lock"
+PORT_FILE = INSTANCE_DIR / "instance.port"
+# how long a later invocation waits for a primary that has taken the lock
+# but not yet written its port
+STARTUP_WAIT = 5
+
+# the primary's lock file, held open for the life of the process
+_lock_handle = None
+
+
+def _lock(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    handle = open(path, "a+")
+    try:
+        if sys.platform == "win32":
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return None
+    return handle
+
+
+def _bind(port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if sys.platform == "win32":
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_EXCLUSIVEADDRUSE, 1)
+    else:
+        # so a restart can bind while the last run's connections are in
+        # TIME_WAIT; elsewhere this still refuses a second listener
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    try:
+        sock.bind(("127.0.0.1", port))
+    except OSError:
+        sock.close()
+        raise
+    sock.listen(5)
+    return sock
+
+
+# Returns a listening socket if this process is the primary instance for this
+# user, or None if another instance already holds the lock. port 0 listens on
+# any free port. Raises OSError if the lock was taken but port can't be bound.
+def claim(port=0):
+    global _lock_handle
+    lock = _lock(LOCK_FILE)
+    if lock is None:
+        return None
+    try:
+        sock = _bind(port)
+    except OSError:
+        lock.close()
+        raise
+    PORT_FILE.write_text(str(sock.getsockname()[1]), encoding="utf-8")
+    _lock_handle = lock
+    return sock
+
+
+def _connect(port, timeout):
+    deadline = time.monotonic() + STARTUP_WAIT
+    while True:
+        try:
+            target = port or int(PORT_FILE.read_text(encoding="utf-8"))
+            return socket.create_connection(("127.0.0.1", target), timeout=timeout)
+        except (ConnectionRefusedError, FileNotFoundError, ValueError):
+            # the primary may have the lock but not be listening yet
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+# Send to the primary on port, or on the port it wrote to PORT_FILE if port is
+# 0. Raises OSError if the running instance can't be reached or doesn't
+# answer in time, ValueError if whatever is on the port doesn't reply with a
+# dict.
+def send(message, port=0, timeout=30):
+    message = {**message, "user": getpass.getuser()}
+    with _connect(port, timeout) as sock:
+        sock.sendall((json.dumps(message) + "\n").encode("utf-8"))
+        reply = sock.makefile("r", encoding="utf-8").readline()
+    if not reply:
+        return {"ok": False, "error": "no reply"}
+    reply = json.loads(reply)
+    if not isinstance(reply, dict):
+        raise ValueError(f"unexpected reply {reply!r}")
+    return reply
+
+
+# Answer requests from later invocations on a daemon thread. handler(message)
+# is called on that thread and returns the reply dict.
+def serve(sock, handler):
+    user = getpass.getuser()
+
+    def handle(conn):
+        with conn:
+            try:
+                line = conn.makefile("r", encoding="utf-8").readline()
+                message = json.loads(line)
+                if message.pop("user", None) != user:
+                    reply = {"ok": False, "error": "This copy belongs to another user."}
+                else:
+                    reply = handler(message)
+            except Exception as e:
+                reply = {"ok": False, "error": str(e)}
+            try:
+                conn.sendall((json.dumps(reply) + "\n").encode("utf-8"))
+            except OSError:
+                pass
+
+    def accept_loop():
+        while True:
+            try:
+                conn, _ = sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+    threading.Thread(
+        target=accept_loop, name="seatsomatic-instance", daemon=True
+    ).start()
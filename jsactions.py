@@ -1,21 +1,33 @@
+import json
+
+from rowmatch import ROW_THRESHOLD, ROW_WEIGHTS, row_target
+
+
 class JSAction:
 
     def __init__(self,jscode):
-        self.jscode=rf"""
+        self.jscode=jscode
+
+    def script(self,token):
+        return rf"""
+        window.__seatsomatic_attempts=0;
         (function(){{
-                {jscode}
-        }})().then(window.pywebview.api.action_success).catch(window.pywebview.api.action_fail);"""
+                {self.jscode}
+        }})().then(function(result){{window.pywebview.api.action_result({token},true,result,window.__seatsomatic_attempts);}})
+        .catch(function(error){{window.pywebview.api.action_result({token},false,String(error),window.__seatsomatic_attempts);}});"""
+
+    # awaitable: resolves with the value the JS promise resolved to, raises
+    # engine.ActionFailed if it rejected; re-issued if the page reloads
+    async def run(self,bridge):
+        return await bridge.run_action(self)
 
+    # whether the value the JS resolved to counts as success
+    def succeeded(self,result):
+        return result is True
 
-    def apply(self,window,callback,exceptionCallback):
-#        print(f"Applying JSAction {self} with code: \n")
-#        print(self.jscode)
-        try:
-            window.run_js(self.jscode)
-#            print("JSAction applied successfully:")
-        except Exception as e:
-            print(f"Error applying JSAction {self}: {e}")
-            exceptionCallback(str(e))
+    # log anything interesting about the result, success or not
+    def report(self,result):
+        pass
 
 
 class JSWait(JSAction):
@@ -43,8 +55,10 @@ try {
         {
             var elapsed=0;
             while(python_timeout==0 || elapsed<python_timeout){
-                if(doIt()){
-                    return true;
+                window.__seatsomatic_attempts++;
+                let result=doIt();
+                if(result){
+                    return result;
                 }
                 if(timeout<=0){
                     await new Promise(resolve => setTimeout(resolve, 2000));
@@ -63,10 +77,10 @@ class JSActionBringToFront(JSDoSomethingWithTimeout):
     def __init__(self):
         super().__init__("return true",timeout=1000)
 
-    def apply(self,window,callback,exceptionCallback):
-        window.on_top = True
+    async def run(self,bridge):
+        await bridge.call(bridge.driver.set_on_top,bridge.window,True)
         print(f"Bringing window to front for JSAction {self}")
-        super().apply(window,callback,exceptionCallback)
+        return await super().run(bridge)
 
 
 class JSDoLoginPages(JSDoSomethingWithTimeout):
@@ -225,3 +239,370 @@ class JSHoldWhileVisible(JSDoSomethingWithTimeout):
                 return true;
             }
         """,timeout=timeout)
+
+
+class JSScrapeRows(JSDoSomethingWithTimeout):
+    # resolves with the whitespace-collapsed text of every row that has a
+    # click_selector element in it
+    def __init__(self,click_selector,*,element_type="tr",timeout=5000):
+        click_selector=click_selector.replace("'","\\'")
+        super().__init__(f"""
+            let click_selector='{click_selector}';
+            let rows=[];
+            for(let row of document.querySelectorAll('{element_type}')){{
+                if(row.querySelector(click_selector)){{
+                    rows.push((row.textContent||"").replace(/\\s+/g," ").trim());
+                }}
+            }}
+            console.log("Scraped rows:",rows.length);
+            return rows.length>0?rows:false;
+        """,timeout=timeout)
+
+    def succeeded(self,result):
+        return isinstance(result,list)
+
+
+# finds the QR code in the dialog whose heading matches heading_xpath and
+# returns {image, link, text}, image being a data: URL where the page allows it
+QR_EXTRACT_JS=r"""
+function extractQRCode(heading_xpath){
+    let heading=document.evaluate(heading_xpath,document,null,XPathResult.FIRST_ORDERED_NODE_TYPE,null).singleNodeValue;
+    if(!heading){
+        return null;
+    }
+    let dialog=heading.closest('mat-dialog-container,[role="dialog"],.cdk-overlay-pane,.modal')||heading.parentElement;
+    function bigEnough(element){
+        let rect=element.getBoundingClientRect();
+        return rect.width>=100 && rect.height>=100;
+    }
+    let image=null;
+    for(let canvas of dialog.querySelectorAll('canvas')){
+        if(bigEnough(canvas)){
+            try{
+                image=canvas.toDataURL('image/png');
+                break;
+            }catch(e){
+                console.log("Can't read QR canvas:",e);
+            }
+        }
+    }
+    if(!image){
+        for(let img of dialog.querySelectorAll('img')){
+            if(img.complete && img.naturalWidth>0 && bigEnough(img)){
+                image=img.src;
+                if(!image.startsWith('data:')){
+                    try{
+                        let canvas=document.createElement('canvas');
+                        canvas.width=img.naturalWidth;
+                        canvas.height=img.naturalHeight;
+                        canvas.getContext('2d').drawImage(img,0,0);
+                        image=canvas.toDataURL('image/png');
+                    }catch(e){
+                        console.log("QR image is cross-origin, using its URL");
+                    }
+                }
+                break;
+            }
+        }
+    }
+    if(!image){
+        for(let svg of dialog.querySelectorAll('svg')){
+            if(bigEnough(svg)){
+                let xml=new XMLSerializer().serializeToString(svg);
+                image='data:image/svg+xml;base64,'+btoa(unescape(encodeURIComponent(xml)));
+                break;
+            }
+        }
+    }
+    let link=dialog.querySelector('a[href]');
+    return {
+        image:image,
+        link:link?link.href:null,
+        text:(dialog.textContent||"").replace(/\s+/g," ").trim()
+    };
+}
+"""
+
+
+class JSExtractQRCode(JSDoSomethingWithTimeout):
+    def __init__(self,heading_xpath,*,timeout=5000):
+        heading_xpath=heading_xpath.replace("'","\\'")
+        super().__init__(QR_EXTRACT_JS+f"""
+            let qr=extractQRCode('{heading_xpath}');
+            if(!qr || !qr.image){{
+                return false;
+            }}
+            window.__seatsomatic_qr=qr.image;
+            console.log("Extracted QR code");
+            return qr;
+        """,timeout=timeout)
+
+    def succeeded(self,result):
+        return isinstance(result,dict) and bool(result.get("image"))
+
+
+class JSWatchQRCode(JSDoSomethingWithTimeout):
+    # polls slowly until the QR code in the dialog changes (resolves with the
+    # new {image, link, text}) or the dialog goes away (resolves {closed:true})
+    def __init__(self,heading_xpath):
+        heading_xpath=heading_xpath.replace("'","\\'")
+        super().__init__(QR_EXTRACT_JS+f"""
+            let qr=extractQRCode('{heading_xpath}');
+            if(!qr){{
+                console.log("QR dialog closed");
+                return {{closed:true}};
+            }}
+            if(qr.image && qr.image!==window.__seatsomatic_qr){{
+                console.log("QR code changed");
+                window.__seatsomatic_qr=qr.image;
+                return qr;
+            }}
+            return false;
+        """,timeout=0)
+
+    def succeeded(self,result):
+        return isinstance(result,dict)
+
+
+class JSClickBestRow(JSAction):
+    # Scores every row in a single pass on module code, start time and
+    # location, after normalising case, punctuation and 12/24 hour times, and
+    # clicks click_selector in the best row scoring at least threshold.
+    # Resolves {clicked, candidates} with the top candidates either way;
+    # only polls again while no row reaches the threshold. The rules are
+    # those of rowmatch.score_row, which the day plan uses.
+    def __init__(self,module_code,location,hour,minute,click_selector,*,element_type="tr",threshold=ROW_THRESHOLD,timeout=5000):
+        target=row_target(module_code,location,hour,minute)
+        super().__init__(f"""
+            const target={json.dumps(target)};
+            const click_selector={json.dumps(click_selector)};
+            const element_type={json.dumps(element_type)};
+            const weights={json.dumps(ROW_WEIGHTS)};
+            const threshold={threshold};
+            const python_timeout={timeout};"""+r"""
+            function rowTimes(text){
+                let times=[];
+                for(let m of text.matchAll(/(\d{1,2})[:.](\d{2})\s*(am|pm|a\.m\.|p\.m\.)?/gi)){
+                    let hour=parseInt(m[1]);
+                    let suffix=(m[3]||"").toLowerCase().replace(/\./g,"");
+                    if(suffix==="pm" && hour<12){ hour+=12; }
+                    if(suffix==="am" && hour===12){ hour=0; }
+                    times.push(hour*60+parseInt(m[2]));
+                }
+                return times;
+            }
+            function scoreRow(row){
+                let text=(row.textContent||"").replace(/\s+/g," ").trim();
+                let compact=text.toLowerCase().replace(/[^a-z0-9]/g,"");
+                let module=0;
+                if(target.module && compact.includes(target.module)){
+                    module=1;
+                }else if(target.module_prefix && compact.includes(target.module_prefix)){
+                    module=0.7;
+                }
+                let time=rowTimes(text).includes(target.minutes)?1:0;
+                let location=0;
+                if(target.location && compact.includes(target.location)){
+                    location=1;
+                }else if(target.location_tokens.length>0){
+                    let found=target.location_tokens.filter(t=>compact.includes(t)).length;
+                    location=found/target.location_tokens.length;
+                }
+                // fields the event doesn't have (e.g. no module code in the
+                // description) are left out and the rest re-weighted
+                let parts={module:module,time:time,location:location};
+                let score=0,total=0;
+                for(let [name,weight] of Object.entries(weights)){
+                    if(name!=="time" && !target[name]){
+                        continue;
+                    }
+                    score+=weight*parts[name];
+                    total+=weight;
+                }
+                score=score/total;
+                return {score:Math.round(score*1000)/1000,module:module,time:time,location:Math.round(location*100)/100,text:text.slice(0,200)};
+            }
+            async function findBestRow(){
+                let elapsed=0;
+                let candidates=[];
+                while(true){
+                    window.__seatsomatic_attempts++;
+                    let scored=[];
+                    for(let row of document.querySelectorAll(element_type)){
+                        if(row.querySelector(click_selector)){
+                            scored.push([scoreRow(row),row]);
+                        }
+                    }
+                    scored.sort((a,b)=>b[0].score-a[0].score);
+                    candidates=scored.slice(0,5).map(s=>s[0]);
+                    if(scored.length>0 && scored[0][0].score>=threshold){
+                        console.log('Best row:',scored[0][0].score,scored[0][0].text);
+                        scored[0][1].querySelector(click_selector).click();
+                        return {clicked:true,candidates:candidates};
+                    }
+                    if(elapsed>=python_timeout){
+                        return {clicked:false,candidates:candidates};
+                    }
+                    await new Promise(resolve => setTimeout(resolve, 200));
+                    elapsed+=200;
+                }
+            }
+            return findBestRow();
+        """)
+
+    def succeeded(self,result):
+        return isinstance(result,dict) and result.get("clicked") is True
+
+    def report(self,result):
+        if not isinstance(result,dict):
+            return
+        print("Row candidates (best first):")
+        for candidate in result.get("candidates",[]):
+            print(f"  {candidate['score']:.3f} module={candidate['module']} time={candidate['time']} location={candidate['location']} | {candidate['text']}")
+
+
+class JSClickPlannedRow(JSClickBestRow):
+    # The day plan has already seen this event's row, so it should be on the
+    # page straight away; scored like JSClickBestRow so a row whose cells
+    # changed since the plan was taken still matches.
+    def __init__(self,module_code,location,hour,minute,click_selector,*,element_type="tr",timeout=2000):
+        super().__init__(module_code,location,hour,minute,click_selector,element_type=element_type,timeout=timeout)
+
+
+# Watches DOM mutations and network requests so the readiness waits can
+# tell how long the page has been quiet. Installed once per page, when it
+# loads (see BrowserSession), so quiet time counts from the last mutation
+# rather than from the first poll; the waits install it themselves if the
+# page load was missed.
+PAGE_OBSERVERS_JS=r"""
+function installSeatsomaticObservers(){
+    if(!window.__seatsomatic_dom){
+        let dom={last:performance.now()};
+        window.__seatsomatic_dom=dom;
+        new MutationObserver(()=>{dom.last=performance.now();}).observe(document,{subtree:true,childList:true,attributes:true});
+    }
+    if(!window.__seatsomatic_net){
+        let net={inflight:0,last:performance.now(),resources:0};
+        window.__seatsomatic_net=net;
+        let done=()=>{net.inflight--;net.last=performance.now();};
+        let originalFetch=window.fetch;
+        window.fetch=function(...args){
+            net.inflight++;
+            return originalFetch.apply(this,args).finally(done);
+        };
+        let originalSend=XMLHttpRequest.prototype.send;
+        XMLHttpRequest.prototype.send=function(...args){
+            net.inflight++;
+            this.addEventListener('loadend',done);
+            return originalSend.apply(this,args);
+        };
+    }
+}
+installSeatsomaticObservers();
+"""
+
+# Readiness conditions for JSWaitFor. Each defines a JS function ready()
+# that is polled until it returns true.
+WAIT_HELPERS_JS=PAGE_OBSERVERS_JS+r"""
+function domQuietFor(ms){
+    return performance.now()-window.__seatsomatic_dom.last>=ms;
+}
+function angularStable(quiet_ms){
+    if(window.getAllAngularTestabilities){
+        let testabilities=window.getAllAngularTestabilities();
+        if(testabilities.length>0 && testabilities.every(t=>t.isStable())){
+            return true;
+        }
+    }
+    // apps with background timers never report stable, so a quiet DOM counts
+    return domQuietFor(quiet_ms);
+}
+function networkIdleFor(ms){
+    let net=window.__seatsomatic_net;
+    let resources=performance.getEntriesByType('resource').length;
+    if(resources!==net.resources){
+        net.resources=resources;
+        net.last=performance.now();
+    }
+    return net.inflight<=0 && performance.now()-net.last>=ms;
+}
+function isVisible(element){
+    return !!element && element.getClientRects().length>0;
+}
+"""
+
+
+class JSWaitFor(JSAction):
+    # Waits until ready() is true, for at most timeout ms, then carries on
+    # either way like the fixed JSWait it replaces. Resolves with how long it
+    # actually waited so the saving against `replaces` ms can be reported.
+    def __init__(self,name,ready_js,*,timeout,replaces=0):
+        self.name=name
+        self.replaces=replaces
+        super().__init__(WAIT_HELPERS_JS+f"""
+            function ready(){{
+                {ready_js}
+            }}
+            const name={json.dumps(name)};
+            const python_timeout={timeout};"""+"""
+            async function waitUntilReady(){
+                let started=performance.now();
+                while(true){
+                    window.__seatsomatic_attempts++;
+                    let met=false;
+                    try{
+                        met=!!ready();
+                    }catch(error){
+                        console.error(error);
+                    }
+                    let waited=Math.round(performance.now()-started);
+                    if(met || waited>=python_timeout){
+                        if(!met){
+                            console.log("Gave up waiting for",name,"after",waited,"ms");
+                        }
+                        return {waited:waited,met:met};
+                    }
+                    await new Promise(resolve => setTimeout(resolve, 50));
+                }
+            }
+            return waitUntilReady();
+        """)
+
+    def succeeded(self,result):
+        return isinstance(result,dict)
+
+    def report(self,result):
+        if isinstance(result,dict):
+            state="ready" if result.get("met") else "not ready, gave up"
+            print(f"{self.name}: {state} after {result.get('waited')}ms (fixed wait was {self.replaces}ms)")
+
+    def __str__(self):
+        return f"JSWaitFor({self.name})"
+
+
+class JSWaitForElement(JSWaitFor):
+    def __init__(self,selector,*,timeout=3000,replaces=0):
+        super().__init__(f"element {selector}",f"""
+            return isVisible(document.querySelector({json.dumps(selector)}));
+        """,timeout=timeout,replaces=replaces)
+
+
+class JSWaitForVisibleXPath(JSWaitFor):
+    def __init__(self,xpath,*,timeout=5000,replaces=0):
+        super().__init__(f"visible {xpath}",f"""
+            let node=document.evaluate({json.dumps(xpath)},document,null,XPathResult.FIRST_ORDERED_NODE_TYPE,null).singleNodeValue;
+            return isVisible(node);
+        """,timeout=timeout,replaces=replaces)
+
+
+class JSWaitForAngular(JSWaitFor):
+    # a quiet DOM counts as stable after 150ms, or after the fixed delay
+    # being replaced if that was shorter, so the wait is never the slower
+    def __init__(self,*,timeout=1000,replaces=0):
+        quiet_ms=min(150,replaces) if replaces else 150
+        super().__init__("angular stable",f"return angularStable({quiet_ms});",timeout=timeout,replaces=replaces)
+
+
+class JSWaitForNetworkIdle(JSWaitFor):
+    def __init__(self,*,idle_ms=250,timeout=3000,replaces=0):
+        super().__init__("network idle",f"return networkIdleFor({idle_ms});",timeout=timeout,replaces=replaces)
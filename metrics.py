@@ -0,0 +1,150 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Optional Prometheus-format metrics on localhost. Until start_server() is
+# called REGISTRY is None and every recording function returns immediately,
+# so call sites don't need to check whether metrics are enabled.
+
+REGISTRY = None
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.help = {}
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+
+    def describe(self, name, kind, text):
+        self.help[name] = (kind, text)
+
+    def inc(self, name, labels, amount):
+        key = _label_key(labels)
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, value, labels, buckets):
+        key = _label_key(labels)
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = [buckets, [0] * len(buckets), 0, 0.0]
+            for i, bound in enumerate(hist[0]):
+                if value <= bound:
+                    hist[1][i] += 1
+            hist[2] += 1
+            hist[3] += value
+
+    def render(self):
+        lines = []
+
+        def header(name, default_kind):
+            kind, text = self.help.get(name, (default_kind, ""))
+            if text:
+                lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self.lock:
+            for name, series in sorted(self.counters.items()):
+                header(name, "counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+            for name, series in sorted(self.histograms.items()):
+                header(name, "histogram")
+                for key, (buckets, counts, count, total) in series.items():
+                    for bound, bucket_count in zip(buckets, counts):
+                        labels = _format_labels(key, [("le", bound)])
+                        lines.append(f"{name}_bucket{labels} {bucket_count}")
+                    labels = _format_labels(key, [("le", "+Inf")])
+                    lines.append(f"{name}_bucket{labels} {count}")
+                    lines.append(f"{name}_count{_format_labels(key)} {count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {total}")
+            gauges = sorted(self.gauges.items())
+        # gauges are read at scrape time, outside the lock
+        for name, fn in gauges:
+            try:
+                value = fn()
+            except Exception:
+                value = None
+            if value is None:
+                continue
+            header(name, "gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def inc(name, labels=None, amount=1):
+    if REGISTRY is None:
+        return
+    REGISTRY.inc(name, labels, amount)
+
+
+def observe(name, value, labels=None, buckets=DEFAULT_BUCKETS):
+    if REGISTRY is None:
+        return
+    REGISTRY.observe(name, value, labels, buckets)
+
+
+# a gauge whose value is fetched by calling fn() on every scrape
+def gauge(name, fn, text=""):
+    if REGISTRY is None:
+        return
+    REGISTRY.gauges[name] = fn
+    if text:
+        REGISTRY.describe(name, "gauge", text)
+
+
+def describe(name, kind, text):
+    if REGISTRY is None:
+        return
+    REGISTRY.describe(name, kind, text)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Raises OSError if the port can't be bound, leaving metrics disabled.
+def start_server(port, host="127.0.0.1"):
+    global REGISTRY
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    REGISTRY = Registry()
+    threading.Thread(
+        target=server.serve_forever, name="seatsomatic-metrics", daemon=True
+    ).start()
+    print(f"Metrics available at http://{host}:{port}/metrics")
+    return server
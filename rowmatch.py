@@ -0,0 +1,92 @@
+import math
+import re
+
+# How a row of the lectures table is matched to an event. JSClickBestRow runs
+# the same rules in the page and the day plan runs them here on scraped row
+# text, so both paths accept the same rows.
+
+ROW_WEIGHTS = {"module": 0.45, "time": 0.35, "location": 0.2}
+ROW_THRESHOLD = 0.7
+
+_TIME = re.compile(r"(\d{1,2})[:.](\d{2})\s*(am|pm|a\.m\.|p\.m\.)?", re.IGNORECASE)
+
+
+def compact(text):
+    return re.sub(r"[^a-z0-9]", "", (text or "").lower())
+
+
+def row_target(module_code, location, hour, minute):
+    module = compact(module_code)
+    # subject and course number, e.g. comp3007 from COMP/3007/01/SPR
+    prefix = re.match(r"[a-z]+\d{4}", module) or re.match(r"[a-z]+\d+", module)
+    return {
+        "module": module,
+        "module_prefix": prefix.group(0) if prefix else module,
+        "location": compact(location),
+        "location_tokens": [
+            t for t in re.split(r"[^a-z0-9]+", (location or "").lower()) if len(t) >= 2
+        ],
+        "minutes": hour * 60 + minute,
+    }
+
+
+# start times in a row as minutes past midnight, 12 or 24 hour
+def row_times(text):
+    times = []
+    for m in _TIME.finditer(text):
+        hour = int(m.group(1))
+        suffix = (m.group(3) or "").lower().replace(".", "")
+        if suffix == "pm" and hour < 12:
+            hour += 12
+        if suffix == "am" and hour == 12:
+            hour = 0
+        times.append(hour * 60 + int(m.group(2)))
+    return times
+
+
+def _round(value, places):
+    # Math.round, so scores agree with the JS to the last digit
+    scale = 10**places
+    return math.floor(value * scale + 0.5) / scale
+
+
+def score_row(text, target):
+    text = " ".join(text.split())
+    row = compact(text)
+    module = 0
+    if target["module"] and target["module"] in row:
+        module = 1
+    elif target["module_prefix"] and target["module_prefix"] in row:
+        module = 0.7
+    time = 1 if target["minutes"] in row_times(text) else 0
+    location = 0
+    if target["location"] and target["location"] in row:
+        location = 1
+    elif target["location_tokens"]:
+        found = sum(1 for t in target["location_tokens"] if t in row)
+        location = found / len(target["location_tokens"])
+    # fields the event doesn't have (e.g. no module code in the description)
+    # are left out and the rest re-weighted
+    parts = {"module": module, "time": time, "location": location}
+    score = total = 0
+    for name, weight in ROW_WEIGHTS.items():
+        if name != "time" and not target[name]:
+            continue
+        score += weight * parts[name]
+        total += weight
+    return {
+        "score": _round(score / total, 3),
+        "module": module,
+        "time": time,
+        "location": _round(location, 2),
+        "text": text[:200],
+    }
+
+
+# (score, row) for the best scoring row, or (0, None) if there are no rows
+def best_row(rows, target):
+    return max(
+        ((score_row(row, target)["score"], row) for row in rows),
+        key=lambda scored: scored[0],
+        default=(0, None),
+    )
@@ -13,6 +13,20 @@ from enum import Enum
 import argparse
 from pathlib import Path
 from jsactions import *
+from engine import Engine, WindowBridge, ActionFailed
+from rowmatch import ROW_THRESHOLD, best_row, compact, row_target
+from drivers import PyWebviewDriver
+from clock import SystemClock
+from procinfo import get_rss_bytes, format_bytes
+import metrics
+import instance
+import gc
+import itertools
+import time
+import asyncio
+import hashlib
+import json
+import concurrent.futures
 from webview.menu import Menu, MenuAction, MenuSeparator
 
 
@@ -20,7 +34,11 @@ def parse_args():
     parser = argparse.ArgumentParser(
         description="Show iCal events and auto-launch lecture webview."
     )
-    parser.add_argument("ical_url", help="URL to the iCal feed")
+    parser.add_argument(
+        "ical_url",
+        nargs="?",
+        help="URL to the iCal feed (if already running, adds it as an extra feed)",
+    )
     parser.add_argument(
         "--testmode",
         "-t",
@@ -30,13 +48,72 @@ def parse_args():
     parser.add_argument(
         "--jsconsole", "-j", action="store_true", help="Open the webview JS console"
     )
+    parser.add_argument(
+        "--presenter",
+        "-p",
+        action="store_true",
+        help="Show just the QR code in a small window and hide the seats app",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics",
+    )
+    parser.add_argument(
+        "--open",
+        metavar="EVENT",
+        help="Open the next event matching EVENT (module code, title or room) now",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Ask the running instance to re-download its calendar feeds",
+    )
+    parser.add_argument(
+        "--instance-port",
+        type=int,
+        default=0,
+        help="Localhost port for the running instance to listen on "
+        "(default: any free port, recorded under ~/.seatsomatic)",
+    )
     return parser.parse_args()
 
 
 LECTURE_URL = "https://uon.seats.cloud/angular/#/lectures"
 BASE_URL = "https://uon.seats.cloud/angular/#/"
 
+# live lecture windows, keyed by event
 OPEN_WINDOWS = {}
+# events that have already been auto-opened, so closing a window doesn't
+# cause it to be reopened; pruned once the event has finished
+OPENED_EVENTS = set()
+
+STATS_INTERVAL = 600
+# (connect, read) timeouts for downloading a feed
+FETCH_TIMEOUT = (10, 60)
+CACHE_DIR = Path.home() / ".seatsomatic" / "cache"
+# longest the running instance spends on one request from another
+# invocation; a refresh fetches every feed in turn, so this bounds that
+REQUEST_TIMEOUT_MAX = 600
+# how long before the start of a lecture its window is opened
+OPEN_LEAD = timedelta(minutes=15)
+
+ENGINE = Engine()
+CLOCK = SystemClock()
+# how sessions talk to their windows; bench_sessions.py swaps in a fake
+DRIVER = PyWebviewDriver()
+
+QR_SELECTOR = 'i[aria-label="QR code"]'
+SEARCH_SELECTOR = (
+    'input[type="search"], input[placeholder*="Search" i], input[name*="search" i]'
+)
+CHECKIN_DIALOG_XPATH = '//H2[contains(.,"Check In")]'
+# show QR codes in a small presenter window instead of the full seats app
+PRESENTER_MODE = False
+PLAN_TIMEOUT = 180
+# today's lectures resolved to their rows in the lectures table, see DayPlan
+DAY_PLAN = None
 
 
 class EventActions(Enum):
@@ -46,17 +123,35 @@ class EventActions(Enum):
     SELECT_DATE = "SELECT_DATE"
     DO_SEARCH = "DO_SEARCH"
     OPEN_QRCODE = "OPEN_QRCODE"
+    OPEN_PLANNED_QRCODE = "OPEN_PLANNED_QRCODE"
+    PRESENT_QRCODE = "PRESENT_QRCODE"
+    HOLD_QRCODE = "HOLD_QRCODE"
+    SCRAPE_ROWS = "SCRAPE_ROWS"
     STOPPED = "STOPPED"
 
 
+QR_STATES = (
+    EventActions.OPEN_QRCODE,
+    EventActions.OPEN_PLANNED_QRCODE,
+    EventActions.PRESENT_QRCODE,
+    EventActions.HOLD_QRCODE,
+)
+
+
 class Event:
+    _ids = itertools.count()
+
     def __init__(self, summary, start, end, description, location):
+        self.event_id = next(Event._ids)
         self.summary = summary
         self.start = start
         self.end = end
         self.description = description
         self.location = location
         self.module_code = self.extract_module_code(description)
+        # when merge_events added this to a running app's list (None if it was
+        # there from startup)
+        self.added_at = None
 
     def extract_module_code(self, description):
         match = re.search(r"Module code:?\s*([A-Z0-9/]+)", description or "")
@@ -64,6 +159,13 @@ class Event:
             match = re.search(r"([A-Z]{4}/\d{4}/\d{2}/[A-Z]+)", description or "")
         return match.group(1) if match else ""
 
+    # take on the details of a newer copy of the same event from the feed
+    def update_from(self, other):
+        self.end = other.end
+        self.description = other.description
+        self.location = other.location
+        self.module_code = other.module_code
+
     def __str__(self):
         return f"{self.summary} | {self.start} - {self.end} | {self.location} | {self.module_code}"
 
@@ -72,49 +174,93 @@ def log_js(message):
     print(f"[JS] {message}")
 
 
+def parse_events(ical_text, now=None):
+    cal = Calendar.from_ical(ical_text)
+    events = []
+    for component in cal.walk():
+        if component.name == "VEVENT":
+            start = component.get("dtstart").dt
+            end = component.get("dtend").dt
+            if isinstance(start, datetime) and (now is None or end > now):
+                summary = str(component.get("summary"))
+                description = str(component.get("description", ""))
+                location = str(component.get("location", ""))
+                event = Event(summary, start, end, description, location)
+                events.append(event)
+    events.sort(key=lambda e: e.start)
+    return events
+
+
+def feed_cache_path(ical_url):
+    name = hashlib.sha1(ical_url.encode("utf-8")).hexdigest()[:16]
+    return CACHE_DIR / f"{name}.ics"
+
+
+def load_cached_events(ical_url):
+    path = feed_cache_path(ical_url)
+    try:
+        events = parse_events(path.read_text(encoding="utf-8"), CLOCK.now())
+    except FileNotFoundError:
+        return []
+    except Exception as e:
+        print(f"Error loading cached events: {e}")
+        return []
+    print(f"Loaded {len(events)} upcoming events from cache")
+    return events
+
+
+def save_cached_feed(ical_url, text):
+    path = feed_cache_path(ical_url)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(text, encoding="utf-8")
+        tmp.replace(path)
+    except OSError as e:
+        print(f"Error caching feed: {e}")
+
+
+# Returns the upcoming events, or None if the feed couldn't be loaded.
 def fetch_events(ical_url):
     try:
         print(f"Fetching iCal from: {ical_url}")
-        r = requests.get(ical_url)
-        cal = Calendar.from_ical(r.text)
-        events = []
-        now = datetime.now(pytz.utc)
-        for component in cal.walk():
-            if component.name == "VEVENT":
-                start = component.get("dtstart").dt
-                end = component.get("dtend").dt
-                if isinstance(start, datetime) and end > now:
-                    summary = str(component.get("summary"))
-                    description = str(component.get("description", ""))
-                    location = str(component.get("location", ""))
-                    event = Event(summary, start, end, description, location)
-                    events.append(event)
-        events.sort(key=lambda e: e.start)
+        r = requests.get(ical_url, timeout=FETCH_TIMEOUT)
+        r.raise_for_status()
+        events = parse_events(r.text, CLOCK.now())
+        save_cached_feed(ical_url, r.text)
         print(f"Total upcoming events: {len(events)}")
         return events
     except Exception as e:
         print(f"Error loading events: {e}")
-        return []
+        return None
 
 
-def build_event_list_html(events):
-    html = """
-    <html><head><meta charset='utf-8'><title>Upcoming Events</title></head><body>
-    <h2>Upcoming Events</h2>
-    <ul>
-    """
-    if not events:
-        html += "<li><b>No upcoming events found.</b></li>"
-    for idx, event in enumerate(events):
+def build_event_items_html(events, status=None):
+    if not events and status is None:
+        return "<li><b>No upcoming events found.</b></li>"
+    html = ""
+    for event in events:
+        idx = event.event_id
         html += (
-            "<li>"
+            f"<li id='event-{idx}'>"
             f"<div class='event' data-index='{idx}' onclick='openEvent({idx})'"
             " style='cursor:pointer; padding:8px; border:1px solid #ddd; border-radius:6px; margin-bottom:8px;'>"
             f"<b>{event.summary}</b><br>Start: {event.start}<br>End: {event.end}<br>Location: {event.location}<br>Module: {event.module_code}"
             "</div></li>"
         )
-    html += """
+    return html
+
+
+def build_event_list_html(events, status=None):
+    html = f"""
+    <html><head><meta charset='utf-8'><title>Upcoming Events</title></head><body>
+    <h2>Upcoming Events</h2>
+    <p id='status'><i>{status or ""}</i></p>
+    <ul id='events'>
+    {build_event_items_html(events, status)}
     </ul>
+    """
+    html += """
     <p>This window will automatically open the lecture page at the event time.</p>
     <script>
         function openEvent(index) {
@@ -124,13 +270,39 @@ def build_event_list_html(events):
                 console.log('pywebview api not ready');
             }
         }
+        function setEvents(items, status) {
+            document.getElementById('events').innerHTML = items;
+            document.getElementById('status').innerHTML = status ? '<i>' + status + '</i>' : '';
+        }
     </script>
     </body></html>
     """
     return html
 
 
-def get_actions_for_state(state, event):
+def build_presenter_html(event):
+    return f"""
+    <html><head><meta charset='utf-8'><title>Check In</title>
+    <style>
+        body {{ margin:0; background:#fff; font-family:sans-serif; text-align:center; }}
+        h3 {{ margin:8px; }}
+        img {{ max-width:95vw; max-height:80vh; image-rendering:pixelated; }}
+        #link {{ font-size:small; word-break:break-all; }}
+    </style></head><body>
+    <h3>{event.summary}</h3>
+    <img id='qr' alt='QR code'>
+    <div id='link'></div>
+    <script>
+        function showQR(qr) {{
+            document.getElementById('qr').src = qr.image;
+            document.getElementById('link').textContent = qr.link || '';
+        }}
+    </script>
+    </body></html>
+    """
+
+
+def get_actions_for_state(state, event, planned_row=None, presenter=False):
     start_formatted = event.start.strftime("%d %B %Y")
     end_formatted = event.end.strftime("%d %B %Y")
     ACTIONS_FOR_STATE = {
@@ -143,252 +315,925 @@ def get_actions_for_state(state, event):
                 timeout=5000,
             ),
             JSClickByText("Yes", element_type="input", timeout=2000),
-            JSWait(timeout=500),
+            JSWaitForNetworkIdle(timeout=2000, replaces=500),
         ],
         EventActions.NAVIGATE_TO_PAGE: [JSNavigateToMainPage(BASE_URL, LECTURE_URL)],
         EventActions.SELECT_DATE: [
-            JSWait(timeout=100),
+            JSWaitForAngular(replaces=100),
             JSClickByText("Start Date", element_type="label", timeout=5000),
-            JSWait(timeout=500),
+            JSWaitForElement(
+                f'#calendarStart button[aria-label="{start_formatted}"]', replaces=500
+            ),
             JSClickBySelector(f'#calendarStart button[aria-label="{start_formatted}"]'),
             JSClickBySelector(f'#calendarEnd button[aria-label="{end_formatted}"]'),
             JSClickByText("Select Range", element_type="button"),
         ],
         EventActions.DO_SEARCH: [
-            JSWait(timeout=100),
-            JSClickBySelector(
-                'input[type="search"], input[placeholder*="Search" i], input[name*="search" i]'
-            ),
-            JSWait(timeout=100),
-            JSInputBySelector(
-                'input[type="search"], input[placeholder*="Search" i], input[name*="search" i]',
-                value=event.module_code,
-            ),
+            JSWaitForAngular(replaces=100),
+            JSClickBySelector(SEARCH_SELECTOR),
+            JSWaitForAngular(replaces=100),
+            JSInputBySelector(SEARCH_SELECTOR, value=event.module_code),
         ],
         EventActions.OPEN_QRCODE: [
-            JSClickByMultiText(
-                [event.module_code, event.location, event.start.strftime("%H:%M")],
-                click_selector='i[aria-label="QR code"]',
+            JSClickBestRow(
+                event.module_code,
+                event.location,
+                event.start.hour,
+                event.start.minute,
+                click_selector=QR_SELECTOR,
                 element_type="tr",
                 timeout=5000,
             ),
-            JSWait(timeout=1000),
-            JSActionBringToFront(),
-            JSWait(timeout=1000),
-            JSHoldWhileVisibleXPath('//H2[contains(.,"Check In")]'),
-            JSWait(timeout=1000),
+        ],
+        EventActions.SCRAPE_ROWS: [
+            JSWaitForNetworkIdle(timeout=5000, replaces=1000),
+            JSScrapeRows(QR_SELECTOR, element_type="tr", timeout=10000),
         ],
     }
-    return ACTIONS_FOR_STATE.get(state, [])
+    if planned_row is not None:
+        ACTIONS_FOR_STATE[EventActions.OPEN_PLANNED_QRCODE] = [
+            JSClickPlannedRow(
+                event.module_code,
+                event.location,
+                event.start.hour,
+                event.start.minute,
+                click_selector=QR_SELECTOR,
+                element_type="tr",
+            )
+        ]
+    actions = ACTIONS_FOR_STATE.get(state, [])
+    dialog_open = JSWaitForVisibleXPath(CHECKIN_DIALOG_XPATH, replaces=1000)
+    hold_actions = [
+        JSActionBringToFront(),
+        JSWaitForVisibleXPath(CHECKIN_DIALOG_XPATH, timeout=1000, replaces=1000),
+        JSHoldWhileVisibleXPath(CHECKIN_DIALOG_XPATH),
+        # let the table settle before the QR code is opened again
+        JSWaitForAngular(timeout=3000, replaces=1000),
+    ]
+    if state in (EventActions.OPEN_QRCODE, EventActions.OPEN_PLANNED_QRCODE):
+        if presenter:
+            actions = actions + [dialog_open, JSExtractQRCode(CHECKIN_DIALOG_XPATH)]
+        else:
+            actions = actions + [dialog_open] + hold_actions
+    elif state == EventActions.PRESENT_QRCODE:
+        actions = [JSWatchQRCode(CHECKIN_DIALOG_XPATH)]
+    elif state == EventActions.HOLD_QRCODE:
+        actions = hold_actions
+    return actions
+
+
+def event_row_target(event):
+    return row_target(
+        event.module_code, event.location, event.start.hour, event.start.minute
+    )
+
+
+class DayPlan:
+    # One scrape of the lectures table for a whole day, with each of that
+    # day's events mapped to the text of its row. Sessions click straight
+    # into the cached row and only fall back to a search if it's gone.
+    def __init__(self, day):
+        self.day = day
+        self.captured_at = None
+        self.rows = []
+        self.targets = {}
+        self.failed = False
+
+    def resolve(self, rows, events, now):
+        self.captured_at = now
+        self.rows = rows
+        self.targets = {}
+        for event in events:
+            # same scoring as JSClickBestRow, so the plan picks the row a
+            # search would have clicked
+            score, row = best_row(rows, event_row_target(event))
+            if row is None or score < ROW_THRESHOLD:
+                print(f"Day plan: no row found for {event}")
+            else:
+                self.targets[event] = row
+        print(
+            f"Day plan for {self.day}: {len(rows)} rows, "
+            f"{len(self.targets)}/{len(events)} events matched"
+        )
+
+    def target_for(self, event):
+        if self.failed or self.captured_at is None:
+            return None
+        return self.targets.get(event)
+
+
+def events_on_day(events, day):
+    return [e for e in events if e.start.astimezone().date() == day]
+
+
+NEXT_STATE = {
+    EventActions.INIT_ACTIONS: (
+        EventActions.NAVIGATE_TO_PAGE,
+        "Initializing actions, starting with navigate to page",
+    ),
+    EventActions.LOGIN_TO_SYSTEM: (
+        EventActions.NAVIGATE_TO_PAGE,
+        "Finished login, moving to navigate to page",
+    ),
+    EventActions.NAVIGATE_TO_PAGE: (
+        EventActions.SELECT_DATE,
+        "Finished navigating to page, moving to select date",
+    ),
+    EventActions.SELECT_DATE: (
+        EventActions.DO_SEARCH,
+        "Finished selecting date, moving to search",
+    ),
+    EventActions.DO_SEARCH: (
+        EventActions.OPEN_QRCODE,
+        "Finished search, moving to open QR code",
+    ),
+    EventActions.OPEN_QRCODE: (
+        EventActions.OPEN_QRCODE,
+        "Reloading QR code as it has closed",
+    ),
+    EventActions.OPEN_PLANNED_QRCODE: (
+        EventActions.OPEN_PLANNED_QRCODE,
+        "Reloading QR code as it has closed",
+    ),
+    EventActions.HOLD_QRCODE: (
+        EventActions.OPEN_QRCODE,
+        "Reloading QR code as it has closed",
+    ),
+}
+
+
+class BrowserSession:
+    # One window and the task driving it through EventActions. All state
+    # lives on the engine thread; pywebview callbacks hop over to it.
+    def __init__(self, event, window):
+        self.event = event
+        self.window = window
+        self.bridge = WindowBridge(
+            ENGINE, DRIVER, window, page_setup=PAGE_OBSERVERS_JS
+        )
+        self.state = EventActions.INIT_ACTIONS
+        self.action = None
+        self.task = None
+
+    def start(self):
+        self.task = ENGINE.loop.create_task(self.run())
+
+    async def run(self):
+        await self.bridge.wait_loaded()
+        state = self.next_state(EventActions.INIT_ACTIONS, [])
+        while state != EventActions.STOPPED:
+            self.state = state
+            print("Handling state:", state)
+            state_started = time.monotonic()
+            try:
+                results = await self.run_actions(state)
+            except ActionFailed as e:
+                print(f"Action {self.action} failed with error:", e.result)
+                self.observe_state(state, state_started, "failed")
+                # on_failure can look at self.action to see what failed
+                state = self.on_failure(state, e)
+                self.action = None
+                continue
+            self.observe_state(state, state_started, "ok")
+            await self.after_state(state, results)
+            if self.state == EventActions.STOPPED:
+                break
+            state = self.next_state(state, results)
+        self.state = EventActions.STOPPED
+
+    def actions_for_state(self, state):
+        return get_actions_for_state(state, self.event)
+
+    def observe_state(self, state, started, outcome):
+        metrics.observe(
+            "seatsomatic_state_duration_seconds",
+            time.monotonic() - started,
+            {"state": state.value, "outcome": outcome},
+        )
+
+    async def run_actions(self, state):
+        results = []
+        waited = fixed = 0
+        for action in self.actions_for_state(state):
+            self.action = action
+            print(f"applying action: {action}")
+            action_name = type(action).__name__
+            started = time.monotonic()
+            try:
+                result = await action.run(self.bridge)
+                action.report(result)
+                if not action.succeeded(result):
+                    raise ActionFailed(result)
+            except ActionFailed:
+                metrics.inc("seatsomatic_action_failures_total", {"action": action_name})
+                raise
+            finally:
+                labels = {"action": action_name}
+                metrics.observe(
+                    "seatsomatic_action_duration_seconds",
+                    time.monotonic() - started,
+                    labels,
+                )
+                metrics.observe(
+                    "seatsomatic_action_retries",
+                    max(self.bridge.last_attempts - 1, 0),
+                    labels,
+                    buckets=metrics.COUNT_BUCKETS,
+                )
+            print("DONE ACTION:", action)
+            if isinstance(action, JSWaitFor):
+                waited += result["waited"]
+                fixed += action.replaces
+            results.append(result)
+        self.action = None
+        if fixed:
+            # a wait can run longer than the delay it replaced, so the two are
+            # counted separately and the difference taken when reading them
+            difference = f"saved {fixed - waited}ms"
+            if waited > fixed:
+                difference = f"lost {waited - fixed}ms"
+            print(
+                f"Readiness waits in {state.value}: {waited}ms against {fixed}ms "
+                f"of fixed delays, {difference}"
+            )
+            labels = {"state": state.value}
+            metrics.inc("seatsomatic_wait_seconds_total", labels, waited / 1000)
+            metrics.inc(
+                "seatsomatic_wait_replaced_seconds_total", labels, fixed / 1000
+            )
+        return results
+
+    async def after_state(self, state, results):
+        pass
+
+    def next_state(self, state, results):
+        state, message = NEXT_STATE[state]
+        print(message)
+        return state
+
+    def on_failure(self, state, error):
+        if state == EventActions.NAVIGATE_TO_PAGE and error.result is False:
+            return EventActions.LOGIN_TO_SYSTEM
+        print("Error, state:", state, "- stopping auto check-in")
+        return EventActions.STOPPED
+
+    def close(self):
+        # drop everything that keeps this session alive once the window is
+        # gone, so a term of sessions doesn't accumulate
+        self.state = EventActions.STOPPED
+        if self.task is not None:
+            self.task.cancel()
+        self.bridge.release()
+        if OPEN_WINDOWS.get(self.event) is self.window:
+            del OPEN_WINDOWS[self.event]
+
+
+class LectureSession(BrowserSession):
+    # In presenter mode, once the Check In dialog is open the QR code is
+    # copied into a small local window and the seats app window is hidden;
+    # the app only polls (slowly) for the code changing or the dialog closing.
+    def __init__(self, event, window, presenter=False):
+        super().__init__(event, window)
+        self.presenter = presenter
+        self.presenter_window = None
+        self.app_hidden = False
+        self.qr_state = EventActions.OPEN_QRCODE
+
+    def actions_for_state(self, state):
+        planned_row = None
+        if state == EventActions.OPEN_PLANNED_QRCODE:
+            planned_row = DAY_PLAN.target_for(self.event) if DAY_PLAN else None
+        return get_actions_for_state(
+            state, self.event, planned_row, presenter=self.presenter
+        )
+
+    async def after_state(self, state, results):
+        if not self.presenter or not results:
+            return
+        if state in (EventActions.OPEN_QRCODE, EventActions.OPEN_PLANNED_QRCODE):
+            self.qr_state = state
+            await self.show_presenter(results[-1])
+        elif state == EventActions.PRESENT_QRCODE:
+            if results[-1].get("closed"):
+                print("Check In dialog closed, waking seats app window")
+                self.app_hidden = False
+                await self.bridge.call(DRIVER.show, self.window)
+            elif self.presenter_window is not None:
+                print("QR code changed, updating presenter window")
+                await self.show_presenter(results[-1])
+
+    async def show_presenter(self, qr):
+        if self.presenter_window is None:
+            presenter_window = await self.bridge.call(
+                lambda: DRIVER.create_window(
+                    f"Check In: {self.event.summary}",
+                    html=build_presenter_html(self.event),
+                    width=520,
+                    height=600,
+                    on_top=True,
+                )
+            )
+            DRIVER.on_closed(
+                presenter_window,
+                lambda: ENGINE.call_soon(self.presenter_closed, presenter_window),
+            )
+            self.presenter_window = presenter_window
+        await self.bridge.call(
+            DRIVER.evaluate_js, self.presenter_window, f"showQR({json.dumps(qr)})"
+        )
+        if not self.app_hidden:
+            self.app_hidden = True
+            await self.bridge.call(DRIVER.hide, self.window)
+
+    def presenter_closed(self, presenter_window):
+        if self.presenter_window is not presenter_window:
+            return
+        print("Presenter window closed, showing seats app instead")
+        self.presenter_window = None
+        self.presenter = False
+        self.app_hidden = False
+        self.bridge.post(DRIVER.show, self.window)
+
+    def next_state(self, state, results):
+        state = self.choose_next_state(state, results)
+        if state == EventActions.OPEN_PLANNED_QRCODE and (
+            DAY_PLAN is None or DAY_PLAN.target_for(self.event) is None
+        ):
+            # the plan was replaced or dropped this row since the last loop
+            print("No day plan row any more, opening the QR code by search")
+            self.qr_state = EventActions.OPEN_QRCODE
+            return EventActions.OPEN_QRCODE
+        return state
+
+    def choose_next_state(self, state, results):
+        if state in (EventActions.OPEN_QRCODE, EventActions.OPEN_PLANNED_QRCODE):
+            if isinstance(results[-1], dict) and "image" in results[-1]:
+                # the QR code was extracted for the presenter window
+                if self.presenter_window is not None:
+                    return EventActions.PRESENT_QRCODE
+                return EventActions.HOLD_QRCODE
+        elif state == EventActions.PRESENT_QRCODE:
+            if results[-1].get("closed"):
+                print("Reloading QR code as it has closed")
+                return self.qr_state
+            if self.presenter_window is None:
+                return EventActions.HOLD_QRCODE
+            return EventActions.PRESENT_QRCODE
+        elif state == EventActions.HOLD_QRCODE:
+            print("Reloading QR code as it has closed")
+            return self.qr_state
+        if state == EventActions.SELECT_DATE and DAY_PLAN is not None:
+            row = DAY_PLAN.target_for(self.event)
+            if row is not None:
+                age = CLOCK.now() - DAY_PLAN.captured_at
+                print(f"Using day plan row captured {age} ago: {row}")
+                return EventActions.OPEN_PLANNED_QRCODE
+        return super().next_state(state, results)
+
+    def on_failure(self, state, error):
+        if isinstance(self.action, JSExtractQRCode):
+            # the dialog is open but its code can't be copied; hold it in
+            # the app window instead of giving up on check-in
+            print("Couldn't read the QR code, showing it in the seats app window")
+            self.presenter = False
+            self.qr_state = state
+            self.close_presenter()
+            if self.app_hidden:
+                self.app_hidden = False
+                self.bridge.post(DRIVER.show, self.window)
+            return EventActions.HOLD_QRCODE
+        if state == EventActions.OPEN_PLANNED_QRCODE:
+            print("Planned row not found, falling back to full search")
+            DAY_PLAN.targets.pop(self.event, None)
+            return EventActions.DO_SEARCH
+        return super().on_failure(state, error)
+
+    def disable_auto_checkin(self):
+        if self.state in QR_STATES:
+            self.state = EventActions.STOPPED
+            if self.task is not None:
+                self.task.cancel()
+            self.close_presenter()
+            print("Auto check-in disabled by user.")
+
+    def close_presenter(self, show_app=True):
+        presenter_window, self.presenter_window = self.presenter_window, None
+        if presenter_window is not None:
+            self.bridge.post(DRIVER.destroy, presenter_window)
+            if show_app:
+                self.app_hidden = False
+                self.bridge.post(DRIVER.show, self.window)
+
+    def close(self):
+        self.close_presenter(show_app=False)
+        super().close()
+
+
+class DayPlanner(BrowserSession):
+    # Runs in a hidden window: selects the whole day's range once and scrapes
+    # every row with a QR code into DAY_PLAN.
+    def __init__(self, plan, day_events, window):
+        day_start = min(e.start for e in day_events)
+        day_end = max(e.end for e in day_events)
+        super().__init__(
+            Event(f"Day plan {plan.day}", day_start, day_end, "", ""), window
+        )
+        self.plan = plan
+        self.day_events = day_events
+
+    async def run(self):
+        try:
+            await asyncio.wait_for(super().run(), PLAN_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f"Day plan for {self.plan.day} timed out")
+            self.plan.failed = True
+        finally:
+            try:
+                await self.bridge.call(DRIVER.destroy, self.window)
+            except Exception as e:
+                print(f"Error closing day plan window: {e}")
+
+    def next_state(self, state, results):
+        if state == EventActions.SELECT_DATE:
+            print("Finished selecting date, scraping rows for day plan")
+            return EventActions.SCRAPE_ROWS
+        if state == EventActions.SCRAPE_ROWS:
+            self.plan.resolve(results[-1], self.day_events, CLOCK.now())
+            return EventActions.STOPPED
+        return super().next_state(state, results)
+
+    def on_failure(self, state, error):
+        if state == EventActions.NAVIGATE_TO_PAGE:
+            # never log in from the hidden window: the sign-in prompt would
+            # appear with nothing on screen to explain it
+            state = EventActions.STOPPED
+        else:
+            state = super().on_failure(state, error)
+        if state == EventActions.STOPPED:
+            print(f"Day plan for {self.plan.day} failed, sessions will search")
+            self.plan.failed = True
+        return state
+
+
+def start_day_plan(day, day_events):
+    # Blocking (creates a hidden window), like open_lecture_webview.
+    global DAY_PLAN
+    DAY_PLAN = DayPlan(day)
+    print(f"Building day plan for {day} ({len(day_events)} events)")
+    plan_window = DRIVER.create_window(
+        f"Day plan {day}", BASE_URL, width=1200, height=800, hidden=True
+    )
+    planner = DayPlanner(DAY_PLAN, day_events, plan_window)
+    DRIVER.expose(plan_window, log_js)
+    DRIVER.on_closed(plan_window, lambda: ENGINE.call_soon(planner.close))
+    ENGINE.call_soon(planner.start)
+    return planner
 
 
 def open_lecture_webview(
     event, module_override=None, location_override=None, time_override=None
 ):
-    # This function is called on the main thread
-    cur_state = EventActions.INIT_ACTIONS
-    current_actions = []
-    this_action = None
-
-    def state_error(error):
-        nonlocal cur_state
-        print("Error, state:", cur_state, error)
-        import sys
-
-        sys.exit(0)
-
-    def handle_state(reloaded=False):
-        nonlocal this_action
-        if this_action is None:
-            action_done()
-        else:
-            if reloaded:
-                # page reloaded
-                print("Page reloaded, reapplying current action:", this_action)
-                this_action.apply(lecture_window, action_done, state_error)
-            else:
-                print("Still waiting for action finish, current action:", this_action)
-
-    def action_error(*argv, **args):
-        print("Error in action:", argv, args)
-        import sys
-
-        sys.exit(-1)
-
-    def action_done(*argv, **args):
-        nonlocal current_actions, cur_state, this_action
-        if this_action is not None:
-            print("DONE ACTION:", this_action)
-        this_action = None
-
-        if len(current_actions) == 0:
-            if cur_state == EventActions.INIT_ACTIONS:
-                print("Initializing actions, starting with navigate to page")
-                cur_state = EventActions.NAVIGATE_TO_PAGE
-            elif cur_state == EventActions.LOGIN_TO_SYSTEM:
-                print("Finished login, moving to navigate to page")
-                cur_state = EventActions.NAVIGATE_TO_PAGE
-            elif cur_state == EventActions.OPEN_QRCODE:
-                print("Reloading QR code as it has closed")
-            elif cur_state == EventActions.DO_SEARCH:
-                print("Finished search, moving to open QR code")
-                cur_state = EventActions.OPEN_QRCODE
-            elif cur_state == EventActions.SELECT_DATE:
-                print("Finished selecting date, moving to search")
-                cur_state = EventActions.DO_SEARCH
-            elif cur_state == EventActions.NAVIGATE_TO_PAGE:
-                print("Finished navigating to page, moving to select date")
-                cur_state = EventActions.SELECT_DATE
-            elif cur_state == EventActions.STOPPED:
-                print("Auto check-in stopped, no further actions will be taken.")
-                return
-            current_actions = get_actions_for_state(cur_state, event)
-        print("Handling state:", cur_state)
-        this_action = current_actions.pop(0)
-        print(f"applying action: {this_action}")
-        this_action.apply(lecture_window, action_done, action_error)
-
-    def on_loaded():
-        print("On loaded")
-        print("W:", lecture_window.evaluate_js("window.toString()"))
-        print("PW:", lecture_window.evaluate_js("window.pywebview.toString()"))
-        print("RL:", lecture_window.evaluate_js("window.pywebview.api.real_loaded"))
-        print("RL:", lecture_window.evaluate_js("window.pywebview.api"))
-        lecture_window.evaluate_js("""
-                                   (function() {
-                                   if(window.called_real_loaded){
-                                   return;
-                                   }
-                                   console.log("In ON LOADED HANDLER");
-                                   async function tryCallRealLoaded(){
-                                        if(window.called_real_loaded){
-                                            return;
-                                        }
-                                        if (window.pywebview && window.pywebview.api && window.pywebview.api.real_loaded) 
-                                        {
-                                              window.called_real_loaded=true;
-                                              console.log("Calling real_loaded from JS");
-                                              console.log("REAL LOADED FUNCTION:",window.pywebview.api.real_loaded);
-                                              window.pywebview.api.real_loaded();
-                                        }
-                                        else{
-                                            console.log("pywebview api not ready for real_loaded, retrying...");
-                                            window.setTimeout(tryCallRealLoaded, 200);
-                                        }
-                                   }
-                                   
-                                   tryCallRealLoaded();
-                                   })();""")
-
-    def real_loaded(*args):
-        print("Loaded new page")
-        handle_state(reloaded=True)
-        return True
-    
+    # Blocking with the pywebview driver (creates the window); call from a
+    # worker thread or via ENGINE.call_driver. The session itself runs as a task on ENGINE.
+    session = None
+
     def disable_auto_checkin():
-        nonlocal cur_state,current_actions,this_action
-        if cur_state == EventActions.OPEN_QRCODE:
-            cur_state = EventActions.STOPPED
-            this_action=None
-            current_actions=[]
-            print("Auto check-in disabled by user.")
+        ENGINE.call_soon(session.disable_auto_checkin)
 
+    def close_window():
+        print(f"Lecture window closed for event: {event}")
+        ENGINE.call_soon(session.close)
 
-    window_menu = [Menu("Settings", [MenuAction("Disable auto-open of checkin",function=disable_auto_checkin)])]
+    window_menu = [
+        Menu(
+            "Settings",
+            [
+                MenuAction(
+                    "Disable auto-open of checkin", function=disable_auto_checkin
+                )
+            ],
+        )
+    ]
 
-    lecture_window = webview.create_window(
+    lecture_window = DRIVER.create_window(
         f"Lecture: {event.summary}", BASE_URL, width=1200, height=800, menu=window_menu
     )
+    session = LectureSession(event, lecture_window, presenter=PRESENTER_MODE)
+    DRIVER.expose(lecture_window, log_js)
+    DRIVER.on_closed(lecture_window, close_window)
     OPEN_WINDOWS[event] = lecture_window
+    OPENED_EVENTS.add(event)
+    ENGINE.call_soon(session.start)
+    return session
 
-    def action_success(result):
-        nonlocal cur_state
-        print("Action success with result:", result)
-        if result == True:
-            action_done(result)
-        else:
-            if cur_state == EventActions.NAVIGATE_TO_PAGE and result == False:
-                cur_state = EventActions.LOGIN_TO_SYSTEM
-                action_done(True)
-                return
-            print(f"Action {this_action} did not return True,Failed:", result)
-            import sys
 
-            sys.exit(-1)
+async def close_lecture_window(event):
+    window = OPEN_WINDOWS.pop(event, None)
+    if window is not None:
+        print(f"Closing lecture window for finished event: {event}")
+        try:
+            await ENGINE.call_driver(DRIVER, DRIVER.destroy, window)
+        except Exception as e:
+            print(f"Error closing lecture window: {e}")
 
-    def action_fail(error):
-        print(f"Action {this_action} failed with error:", error)
-        import sys
 
-        sys.exit(-1)
+class Scheduler:
+    # Decides when lecture windows open and close. The window layer is passed
+    # in as coroutines (open_session, close_session, start_day_plan,
+    # on_finished) and time comes from clock, so the same code drives both
+    # the real app and simulate.py. on_stats is called every STATS_INTERVAL
+    # to log resource use; simulate.py leaves it out so its timings are only
+    # the scheduling itself.
+    def __init__(
+        self,
+        events,
+        open_session,
+        close_session,
+        start_day_plan=None,
+        on_finished=None,
+        on_stats=None,
+        clock=None,
+        testmode=False,
+    ):
+        self.events = events
+        self.open_session = open_session
+        self.close_session = close_session
+        self.start_day_plan = start_day_plan
+        self.on_finished = on_finished
+        self.on_stats = on_stats
+        self.clock = clock or CLOCK
+        self.testmode = testmode
+        self.testmode_used = False
+        self.plan_day = None
+        self.last_stats = None
+        self.started = None
 
-    def close_window():
-        OPEN_WINDOWS[event] = None
+    async def evict_finished_events(self, now):
+        finished = [event for event in self.events if event.end < now]
+        for event in finished:
+            print(f"Event finished, removing: {event}")
+            self.events.remove(event)
+            OPENED_EVENTS.discard(event)
+            await self.close_session(event)
+            if self.on_finished is not None:
+                await self.on_finished(event)
+        return finished
+
+    async def check_events(self):
+        now = self.clock.now()
+        if self.started is None:
+            self.started = now
+        await self.evict_finished_events(now)
+        if self.on_stats is not None and (
+            self.last_stats is None
+            or (now - self.last_stats).total_seconds() >= STATS_INTERVAL
+        ):
+            self.last_stats = now
+            self.on_stats()
+        today = now.astimezone().date()
+        if self.start_day_plan is not None and self.plan_day != today:
+            todays_events = [
+                e for e in events_on_day(self.events, today) if e.end >= now
+            ]
+            if todays_events:
+                self.plan_day = today
+                await self.start_day_plan(today, todays_events)
+        if self.testmode and self.events and not self.testmode_used:
+            print("Test mode: opening specific event immediately.")
+            self.testmode_used = True
+            await self.open_session(self.events[0])
+            return
+        for event in list(self.events):
+            if event.start <= now + OPEN_LEAD and event.end >= now:
+                if event not in OPENED_EVENTS:
+                    print(f"Opening lecture window for event: {event}")
+                    # only events that fell due while the scheduler was watching
+                    # them; one already running at startup or merged in late
+                    # isn't late because of the scheduler
+                    due = event.start - OPEN_LEAD
+                    if due >= max(self.started, event.added_at or self.started):
+                        metrics.observe(
+                            "seatsomatic_scheduler_trigger_lag_seconds",
+                            (now - due).total_seconds(),
+                        )
+                    OPENED_EVENTS.add(event)
+                    await self.open_session(event)
+
+    async def run(self, interval=1):
+        while True:
+            try:
+                await self.check_events()
+            except Exception as e:
+                print(f"Error checking events: {e}")
+            await self.clock.sleep(interval)
+
+
+def get_stats(events):
+    return {
+        "events": len(events),
+        "open_windows": len(OPEN_WINDOWS),
+        "opened_events": len(OPENED_EVENTS),
+        "webview_windows": DRIVER.window_count(),
+        "gc_objects": len(gc.get_objects()),
+        "rss_bytes": get_rss_bytes(),
+    }
+
+
+def log_stats(stats):
+    print(
+        "Stats: "
+        + ", ".join(f"{k}={v}" for k, v in stats.items() if k != "rss_bytes")
+        + f", rss={format_bytes(stats['rss_bytes'])}"
+    )
+
+
+def start_metrics(port, events):
+    try:
+        metrics.start_server(port)
+    except OSError as e:
+        print(f"Couldn't start metrics on port {port}, carrying on without: {e}")
+        return
+    metrics.describe(
+        "seatsomatic_scheduler_trigger_lag_seconds",
+        "histogram",
+        "Delay between event.start - lead and the scheduler opening the window",
+    )
+    metrics.describe(
+        "seatsomatic_state_duration_seconds",
+        "histogram",
+        "Time spent in each EventActions state",
+    )
+    metrics.describe(
+        "seatsomatic_action_duration_seconds", "histogram", "Time taken by each JS action"
+    )
+    metrics.describe(
+        "seatsomatic_action_retries",
+        "histogram",
+        "Polls beyond the first before a JS action completed",
+    )
+    metrics.describe(
+        "seatsomatic_action_failures_total", "counter", "JS actions that failed"
+    )
+    metrics.describe(
+        "seatsomatic_wait_seconds_total", "counter", "Time spent in readiness waits"
+    )
+    metrics.describe(
+        "seatsomatic_wait_replaced_seconds_total",
+        "counter",
+        "Fixed delays the readiness waits replaced",
+    )
+    metrics.gauge(
+        "seatsomatic_open_windows", lambda: len(OPEN_WINDOWS), "Open lecture windows"
+    )
+    metrics.gauge(
+        "seatsomatic_pending_events", lambda: len(events), "Events not yet finished"
+    )
+    metrics.gauge(
+        "seatsomatic_process_resident_memory_bytes",
+        get_rss_bytes,
+        "Resident set size of the process",
+    )
+
+
+def event_key(event):
+    return (event.summary, event.start, event.end, event.location)
+
+
+# Merge freshly fetched events into events in place, keeping the existing
+# Event objects (scheduler and window state is keyed on them). Events that
+# vanished from the feeds are dropped unless they have already been opened.
+# An opened event whose room or end time changed is matched to its new copy
+# on (summary, start) and updated, so the lecture isn't opened a second time.
+def merge_events(events, fetched, prune=False):
+    known = {event_key(e): e for e in events}
+    added = [e for e in fetched if event_key(e) not in known]
+    if prune and added:
+        fetched_keys = {event_key(e) for e in fetched}
+        changed = {
+            (e.summary, e.start): e
+            for e in events
+            if e in OPENED_EVENTS and event_key(e) not in fetched_keys
+        }
+        for event in list(added):
+            opened = changed.pop((event.summary, event.start), None)
+            if opened is not None:
+                print(f"Opened event changed in the feed: {opened} -> {event}")
+                opened.update_from(event)
+                added.remove(event)
+    now = CLOCK.now()
+    for event in added:
+        event.added_at = now
+    events.extend(added)
+    removed = []
+    if prune:
+        keep = {event_key(e) for e in fetched}
+        removed = [
+            e for e in events if event_key(e) not in keep and e not in OPENED_EVENTS
+        ]
+        for event in removed:
+            events.remove(event)
+    events.sort(key=lambda e: e.start)
+    return added, removed
+
+
+# The next event whose summary, module code or location contains query,
+# ignoring case and punctuation, so COMP3007 finds COMP/3007/01/SPR.
+def find_event(events, query):
+    query = compact(str(query))
+    if not query:
+        return None
+    return next(
+        (
+            e
+            for e in events
+            if any(
+                query in compact(text) for text in (e.summary, e.module_code, e.location)
+            )
+        ),
+        None,
+    )
 
-    lecture_window.expose(action_success)
-    lecture_window.expose(action_fail)
-    lecture_window.expose(real_loaded)
-    lecture_window.events.loaded += on_loaded
-    lecture_window.events.closed += close_window
+
+def instance_request(args):
+    if args.open:
+        return {"command": "open", "query": args.open}
+    if args.refresh:
+        return {"command": "refresh"}
+    if args.ical_url:
+        return {"command": "add_feed", "url": args.ical_url}
+    return {"command": "show"}
 
 
 def main():
+    global PRESENTER_MODE
     args = parse_args()
+    try:
+        server_socket = instance.claim(args.instance_port)
+    except OSError as e:
+        print(f"Couldn't listen on port {args.instance_port}: {e}")
+        return
+    if server_socket is None:
+        print("Seatsomatic is already running, passing request to it.")
+        try:
+            reply = instance.send(
+                instance_request(args),
+                args.instance_port,
+                timeout=REQUEST_TIMEOUT_MAX + 30,
+            )
+        except (OSError, ValueError) as e:
+            print(f"Couldn't pass the request on to the running copy: {e}")
+            return
+        print(reply.get("message") or reply.get("error"))
+        return
+    if not args.ical_url:
+        print("An iCal feed URL is needed to start seatsomatic.")
+        return
+    PRESENTER_MODE = args.presenter
     ical_url = args.ical_url
     testmode = args.testmode
     jsconsole = args.jsconsole
-    events = fetch_events(ical_url)
-    html = build_event_list_html(events)
-    testmode_used = False
+    feeds = [ical_url]
+    # show whatever we had last time straight away; the feed is downloaded
+    # on the engine once the window is up
+    events = load_cached_events(ical_url)
+    if args.metrics_port is not None:
+        start_metrics(args.metrics_port, events)
+    if events:
+        status = "Showing saved timetable, checking for updates..."
+    else:
+        status = "Loading timetable..."
+    html = build_event_list_html(events, status)
 
-    def check_events():
-        nonlocal testmode_used
-        try:
-            now = datetime.now(pytz.utc)
-            if testmode and events and not testmode_used:
-                print("Test mode: opening specific event immediately.")
-                testmode_used = True
-                open_lecture_webview(events[0])
-            else:
-                for event in events:
-                    if event.start <= now + timedelta(minutes=15) and event.end >= now:
-                        if event not in OPEN_WINDOWS:
-                            print(f"Opening lecture window for event: {event}")
-                            open_lecture_webview(event)
-        except Exception as e:
-            print(f"Error checking events: {e}")
-        # Schedule next check on the main thread via JS
-        window.evaluate_js(
-            "setTimeout(() => window.pywebview.api.check_events(), 1000);"
+    async def remove_from_list(event):
+        await ENGINE.blocking(
+            window.evaluate_js,
+            f"document.getElementById('event-{event.event_id}')?.remove();",
         )
 
+    scheduler = Scheduler(
+        events,
+        open_session=lambda event: ENGINE.call_driver(
+            DRIVER, open_lecture_webview, event
+        ),
+        close_session=close_lecture_window,
+        start_day_plan=lambda day, day_events: ENGINE.call_driver(
+            DRIVER, start_day_plan, day, day_events
+        ),
+        on_finished=remove_from_list,
+        on_stats=lambda: log_stats(get_stats(events)),
+        testmode=testmode,
+    )
+
+    async def load_feed():
+        fetched = await ENGINE.blocking(fetch_events, ical_url)
+        if fetched is None:
+            status = "Couldn't download the timetable"
+            if events:
+                status += ", showing the saved copy"
+            await refresh_list(status + ".")
+            return
+        added, removed = merge_events(events, fetched, prune=True)
+        print(f"Timetable loaded: {len(added)} added, {len(removed)} removed")
+        await refresh_list()
+
+    async def load_feed_and_open():
+        # on a first run there's no cache, so --open has to wait for the feed
+        await load_feed()
+        reply = await handle_request(instance_request(args))
+        print(reply.get("message") or reply.get("error"))
+
+    def start_engine():
+        ENGINE.start()
+        ENGINE.submit(scheduler.run())
+        ENGINE.submit(load_feed_and_open() if args.open else load_feed())
+
     def log_div_not_found(label):
         print(f"Could not find '{label}' div. Retrying...")
 
+    async def open_event_async(idx):
+        event = next((e for e in events if e.event_id == idx), None)
+        if event is None:
+            print(f"Invalid event index: {idx}")
+        elif event in OPEN_WINDOWS:
+            print("Window already open for this event.")
+            await ENGINE.call_driver(DRIVER, DRIVER.show, OPEN_WINDOWS[event])
+        else:
+            print(f"Opening lecture window for clicked event: {event}")
+            await ENGINE.call_driver(DRIVER, open_lecture_webview, event)
+
     def open_event(index):
         try:
-            idx = int(index)
-            if 0 <= idx < len(events):
-                event = events[idx]
-                print(f"Opening lecture window for clicked event: {event}")
-                if event in OPEN_WINDOWS and OPEN_WINDOWS[event] is not None:
-                    print("Window already open for this event.")
-                    OPEN_WINDOWS[event].bring_to_front()
-                else:
-                    open_lecture_webview(event)
-            else:
-                print(f"Invalid event index: {index}")
+            ENGINE.submit(open_event_async(int(index)))
         except Exception as e:
             print(f"Error opening event: {e}")
 
+    def stats():
+        current = get_stats(events)
+        log_stats(current)
+        return current
+
+    async def refresh_list(status=None):
+        items = build_event_items_html(events, status)
+        await ENGINE.blocking(
+            window.evaluate_js, f"setEvents({json.dumps(items)}, {json.dumps(status)});"
+        )
+
+    async def handle_request(message):
+        command = message.get("command")
+        if command == "add_feed":
+            url = message.get("url")
+            if url in feeds:
+                await ENGINE.blocking(window.show)
+                return {"ok": True, "message": "Feed already loaded."}
+            fetched = await ENGINE.blocking(fetch_events, url)
+            if fetched is None:
+                return {"ok": False, "error": f"Couldn't load feed {url}."}
+            feeds.append(url)
+            added, _ = merge_events(events, fetched)
+            await refresh_list()
+            return {"ok": True, "message": f"Added feed with {len(added)} new events."}
+        if command == "refresh":
+            fetched = []
+            complete = True
+            for url in feeds:
+                feed_events = await ENGINE.blocking(fetch_events, url)
+                complete = complete and feed_events is not None
+                fetched.extend(feed_events or [])
+            added, removed = merge_events(events, fetched, prune=complete)
+            await refresh_list()
+            return {
+                "ok": True,
+                "message": f"Refreshed: {len(added)} added, {len(removed)} removed.",
+            }
+        if command == "open":
+            event = find_event(events, message.get("query", ""))
+            if event is None:
+                return {"ok": False, "error": f"No event matches {message.get('query')!r}."}
+            await open_event_async(event.event_id)
+            return {"ok": True, "message": f"Opening {event}"}
+        if command == "show":
+            await ENGINE.blocking(window.show)
+            return {"ok": True, "message": "Shown the running instance."}
+        return {"ok": False, "error": f"Unknown command {command!r}."}
+
+    def on_request(message):
+        print(f"Request from another instance: {message}")
+        # allow for every feed being fetched, each taking up to FETCH_TIMEOUT
+        timeout = min(30 + sum(FETCH_TIMEOUT) * len(feeds), REQUEST_TIMEOUT_MAX)
+        try:
+            return ENGINE.submit(handle_request(message)).result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            return {"ok": True, "message": "Still working on it in the running copy."}
+
     window = webview.create_window(
         "Upcoming Teaching Sessions", html=html, width=600, height=800
     )
-    window.expose(check_events)
     window.expose(log_div_not_found)
     window.expose(log_js)
     window.expose(open_event)
-    webview.start(func=check_events, debug=jsconsole, private_mode=False)
+    window.expose(stats)
+    instance.serve(server_socket, on_request)
+    webview.start(func=start_engine, debug=jsconsole, private_mode=False)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,257 @@
+# simulate.py
+# Replay a term of lectures through the real Scheduler on a virtual clock,
+# with the window layer stubbed out, and report how well it did.
+
+import argparse
+import asyncio
+import contextlib
+import io
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import requests
+
+import seatsomatic
+from clock import VirtualClock
+from fixtures import MODULES, ROOMS, TIMEZONE, local_time, make_lecture
+from seatsomatic import OPEN_LEAD, OPENED_EVENTS, Scheduler, parse_events
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Replay a feed through the scheduler on a virtual clock."
+    )
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--ical", help="iCal URL or file to replay")
+    source.add_argument(
+        "--weeks", type=int, default=12, help="Weeks of synthetic timetable (default 12)"
+    )
+    parser.add_argument(
+        "--per-day", type=int, default=4, help="Synthetic lectures per weekday"
+    )
+    parser.add_argument(
+        "--overlap",
+        type=float,
+        default=0.1,
+        help="Chance a synthetic lecture overlaps the previous one",
+    )
+    parser.add_argument(
+        "--tick", type=float, default=1, help="Scheduler interval in seconds"
+    )
+    parser.add_argument(
+        "--no-fast-forward",
+        action="store_true",
+        help="Run every tick instead of skipping ticks where nothing is due",
+    )
+    parser.add_argument(
+        "--events",
+        type=int,
+        default=10000,
+        help="Size of event list to time check_events against (default 10000)",
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--verbose", "-v", action="store_true", help="Show scheduler output"
+    )
+    return parser.parse_args()
+
+
+def synthetic_events(weeks, per_day, overlap, seed):
+    rng = random.Random(seed)
+    today = datetime.now(TIMEZONE).date()
+    monday = today + timedelta(days=7 - today.weekday())
+    events = []
+    for day in range(weeks * 7):
+        date = monday + timedelta(days=day)
+        if date.weekday() >= 5:
+            continue
+        hours = sorted(rng.sample(range(9, 18), min(per_day, 9)))
+        previous_end = None
+        for hour in hours:
+            start = local_time(date, hour)
+            if previous_end is not None and rng.random() < overlap:
+                start = previous_end - timedelta(minutes=30)
+            hours = rng.choice([1, 1, 2])
+            module = rng.choice(MODULES)
+            event = make_lecture(start, module, rng.choice(ROOMS), hours=hours)
+            events.append(event)
+            previous_end = event.end
+    events.sort(key=lambda e: e.start)
+    return events
+
+
+def load_events(source):
+    if Path(source).exists():
+        text = Path(source).read_text(encoding="utf-8")
+    else:
+        text = requests.get(source, timeout=30).text
+    return parse_events(text)
+
+
+# Stands in for pywebview: records when each session was opened and closed.
+class StubWindows:
+    def __init__(self, clock):
+        self.clock = clock
+        self.open = {}
+        self.opened_at = {}
+        self.closed_at = {}
+        self.max_concurrent = 0
+        self.opened_during_other = 0
+
+    async def open_session(self, event):
+        now = self.clock.now()
+        if self.open:
+            self.opened_during_other += 1
+        self.open[event] = now
+        self.opened_at[event] = now
+        self.max_concurrent = max(self.max_concurrent, len(self.open))
+
+    async def close_session(self, event):
+        if self.open.pop(event, None) is not None:
+            self.closed_at[event] = self.clock.now()
+
+
+def next_due(events, now):
+    due = []
+    for event in events:
+        if event not in OPENED_EVENTS:
+            due.append(event.start - OPEN_LEAD)
+        due.append(event.end)
+    return min(due) if due else None
+
+
+async def simulate(events, tick, fast_forward, seed):
+    OPENED_EVENTS.clear()
+    all_events = list(events)
+    phase = random.Random(seed).random() * tick
+    start = events[0].start - OPEN_LEAD - timedelta(hours=1, seconds=phase)
+    clock = VirtualClock(start)
+    seatsomatic.CLOCK = clock
+    stub = StubWindows(clock)
+    scheduler = Scheduler(
+        list(events), stub.open_session, stub.close_session, clock=clock
+    )
+    ticks = 0
+    cpu = 0.0
+    pending_total = 0
+    while scheduler.events:
+        pending_total += len(scheduler.events)
+        started = time.process_time()
+        await scheduler.check_events()
+        cpu += time.process_time() - started
+        ticks += 1
+        steps = 1
+        if fast_forward:
+            due = next_due(scheduler.events, clock.now())
+            if due is not None:
+                steps = max(1, int((due - clock.now()).total_seconds() // tick))
+        clock.advance(steps * tick)
+    return build_report(all_events, stub, ticks, cpu, pending_total, tick)
+
+
+# CPU per check_events call on a list of n pending events, timed directly
+# at the start of term when nothing is due (every event is still scanned)
+async def time_check_events(n, per_day, overlap, seed, calls=20):
+    weeks = -(-n // (per_day * 5))
+    events = synthetic_events(weeks, per_day, overlap, seed)[:n]
+    OPENED_EVENTS.clear()
+    clock = VirtualClock(events[0].start - OPEN_LEAD - timedelta(hours=1))
+    seatsomatic.CLOCK = clock
+    stub = StubWindows(clock)
+    scheduler = Scheduler(events, stub.open_session, stub.close_session, clock=clock)
+    # the first call also logs stats; leave it out of the timing
+    await scheduler.check_events()
+    started = time.process_time()
+    for _ in range(calls):
+        await scheduler.check_events()
+    return len(events), (time.process_time() - started) / calls
+
+
+def summarise(values):
+    if not values:
+        return "n/a"
+    ordered = sorted(values)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return (
+        f"mean {statistics.mean(values):.3f}s, p50 {statistics.median(values):.3f}s, "
+        f"p95 {p95:.3f}s, max {ordered[-1]:.3f}s"
+    )
+
+
+# events that overlap at least one other event; events are sorted by start
+def count_overlapping(events):
+    overlapping = set()
+    latest = None
+    for event in events:
+        if latest is not None and event.start < latest.end:
+            overlapping.add(event)
+            overlapping.add(latest)
+        if latest is None or event.end > latest.end:
+            latest = event
+    return len(overlapping)
+
+
+def build_report(events, stub, ticks, cpu, pending_total, tick):
+    open_lag = [
+        (stub.opened_at[e] - (e.start - OPEN_LEAD)).total_seconds()
+        for e in events
+        if e in stub.opened_at
+    ]
+    close_lag = [
+        (stub.closed_at[e] - e.end).total_seconds() for e in events if e in stub.closed_at
+    ]
+    overlapping = count_overlapping(events)
+    avg_pending = pending_total / ticks if ticks else 0
+    per_tick = cpu / ticks if ticks else 0
+    span = (max(e.end for e in events) - events[0].start).total_seconds()
+    return {
+        "events": len(events),
+        "span": f"{events[0].start} .. {max(e.end for e in events)}",
+        "ticks": ticks,
+        "opened": len(stub.opened_at),
+        "missed": len(events) - len(stub.opened_at),
+        "opened_early": sum(1 for lag in open_lag if lag < 0),
+        "open_lag": summarise(open_lag),
+        "close_lag": summarise(close_lag),
+        "overlapping_events": overlapping,
+        "opened_while_another_open": stub.opened_during_other,
+        "max_concurrent_sessions": stub.max_concurrent,
+        "scheduler_cpu": f"{cpu:.3f}s",
+        "cpu_per_tick": f"{per_tick * 1e6:.1f}us (avg {avg_pending:.0f} pending)",
+        # what ticking every `tick` seconds for the whole span would cost
+        "cpu_over_span_at_real_ticks": f"{per_tick * span / tick:.1f}s",
+        "tick_seconds": tick,
+    }
+
+
+def main():
+    args = parse_args()
+    if args.ical:
+        events = load_events(args.ical)
+    else:
+        events = synthetic_events(args.weeks, args.per_day, args.overlap, args.seed)
+    if not events:
+        print("No events to simulate.")
+        return
+    quiet = contextlib.redirect_stdout(io.StringIO())
+    started = time.perf_counter()
+    with contextlib.nullcontext() if args.verbose else quiet:
+        report = asyncio.run(
+            simulate(events, args.tick, not args.no_fast_forward, args.seed)
+        )
+        if args.events > 0:
+            n, per_call = asyncio.run(
+                time_check_events(args.events, args.per_day, args.overlap, args.seed)
+            )
+            report["check_events_cpu"] = f"{per_call * 1e3:.3f}ms at {n} events"
+    report["wall_time"] = f"{time.perf_counter() - started:.2f}s"
+    width = max(len(k) for k in report)
+    for key, value in report.items():
+        print(f"{key.ljust(width)}  {value}")
+
+
+if __name__ == "__main__":
+    main()